@@ -0,0 +1,246 @@
+"""
+Helpers shared by the benchmark scripts: wide test models, timing and the
+JSON report format.
+
+Every benchmark prints a report like::
+
+    {
+      "benchmark": "conversion",
+      "environment": {"python": "3.11.7", "wtforms": "2.3.3", ...},
+      "results": [
+        {"case": "ndb.model_form", "params": {"width": 50}, "seconds": {...}},
+        ...
+      ]
+    }
+
+In ``--memory`` mode, the results also hold the bytes measured by
+:py:func:`measure_memory`, under ``"memory"`` instead of ``"seconds"``.
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+
+def activate_testbed():
+    """
+    Sets up the App Engine environment variables, without service stubs, so
+    keys can be created. Returns the testbed.
+    """
+    from google.appengine.ext import testbed
+
+    bed = testbed.Testbed()
+    bed.activate()
+    return bed
+
+
+def _ndb_properties():
+    from google.appengine.ext import ndb
+
+    return [
+        lambda: ndb.StringProperty(),
+        lambda: ndb.IntegerProperty(required=True),
+        lambda: ndb.BooleanProperty(),
+        lambda: ndb.FloatProperty(),
+        lambda: ndb.DateTimeProperty(),
+        lambda: ndb.TextProperty(),
+        lambda: ndb.StringProperty(repeated=True),
+        lambda: ndb.StringProperty(choices=["a", "b", "c"]),
+        lambda: ndb.KeyProperty(kind="BenchTarget"),
+        lambda: ndb.JsonProperty(),
+        lambda: ndb.DateProperty(),
+        lambda: ndb.GeoPtProperty(),
+    ]
+
+
+def _db_properties(name):
+    from google.appengine.ext import db
+
+    return [
+        lambda i: db.StringProperty(),
+        lambda i: db.IntegerProperty(required=True),
+        lambda i: db.BooleanProperty(),
+        lambda i: db.FloatProperty(),
+        lambda i: db.DateTimeProperty(),
+        lambda i: db.TextProperty(),
+        lambda i: db.StringListProperty(),
+        lambda i: db.StringProperty(choices=["a", "b", "c"]),
+        lambda i: db.ReferenceProperty(
+            db_target_model(), collection_name="%s_%d_set" % (name.lower(), i)
+        ),
+        lambda i: db.DateProperty(),
+        lambda i: db.GeoPtProperty(),
+    ]
+
+
+def ndb_model(width):
+    """
+    Returns an ``ndb.Model`` class with ``width`` properties, cycling through
+    the common property types.
+    """
+    from google.appengine.ext import ndb
+
+    factories = _ndb_properties()
+    attrs = {"p%d" % i: factories[i % len(factories)]() for i in range(width)}
+    return type("NDBWide%d" % width, (ndb.Model,), attrs)
+
+
+_db_target = []
+
+
+def db_target_model():
+    """Returns the ``db.Model`` class referenced by the wide ``db`` models."""
+    if not _db_target:
+        from google.appengine.ext import db
+
+        class DBBenchTarget(db.Model):
+            name = db.StringProperty()
+
+        _db_target.append(DBBenchTarget)
+    return _db_target[0]
+
+
+def db_model(width):
+    """
+    Returns a ``db.Model`` class with ``width`` properties, cycling through
+    the common property types.
+    """
+    from google.appengine.ext import db
+
+    name = "DBWide%d" % width
+    factories = _db_properties(name)
+    attrs = {"p%d" % i: factories[i % len(factories)](i) for i in range(width)}
+    return type(name, (db.Model,), attrs)
+
+
+class FormData(dict):
+    """Form data in the shape of the request objects WTForms takes."""
+
+    def getlist(self, key):
+        value = self[key]
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        return value
+
+
+def time_calls(func, repeat=5, number=None, budget=0.2):
+    """
+    Times ``func()``, returning the per-call ``median``, ``min`` and ``max``
+    seconds of ``repeat`` batches of ``number`` calls. Without a ``number``,
+    it is chosen so that a batch takes about ``budget`` seconds.
+    """
+    if number is None:
+        number = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            elapsed = time.perf_counter() - start
+            if elapsed >= budget / 10 or number >= 10 ** 6:
+                break
+            number *= 10
+        number = max(1, int(number * budget / elapsed))
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+
+    return {
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def measure_memory(func, number=1):
+    """
+    Calls ``func()`` ``number`` times, keeping the results alive, and returns
+    the memory traced by ``tracemalloc``, in bytes per call: the ``peak``
+    allocated during the calls and what is ``retained`` by the results once
+    garbage is collected.
+
+    ``func`` is called once before tracing, so the caches it fills aren't
+    counted.
+    """
+    func()
+    gc.collect()
+    tracing = tracemalloc.is_tracing()
+    if tracing and hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    else:
+        # A new trace starts without a peak, reset_peak() needs Python 3.9.
+        tracemalloc.stop()
+        tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        results = [func() for _ in range(number)]
+        peak = tracemalloc.get_traced_memory()[1]
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0]
+        del results
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+    return {
+        "peak": (peak - start) / number,
+        "retained": (retained - start) / number,
+        "number": number,
+    }
+
+
+def environment():
+    """Returns the versions the benchmark ran with."""
+    import wtforms
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "wtforms": wtforms.__version__,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def argument_parser(description, memory=False):
+    """
+    Returns an argument parser with the options common to the benchmarks,
+    and the ``--memory`` option for those measuring memory.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="number of timed batches per case"
+    )
+    parser.add_argument("--output", help="file to write the JSON report to")
+    if memory:
+        parser.add_argument(
+            "--memory",
+            action="store_true",
+            help="also measure the memory allocated, with tracemalloc",
+        )
+    return parser
+
+
+def write_report(name, results, output=None):
+    """Writes the JSON report of a benchmark to ``output`` or stdout."""
+    report = {"benchmark": name, "environment": environment(), "results": results}
+    text = json.dumps(report, indent=2, sort_keys=True) + "\n"
+    if output:
+        with open(output, "w") as fp:
+            fp.write(text)
+    else:
+        sys.stdout.write(text)
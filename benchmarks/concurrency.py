@@ -0,0 +1,214 @@
+"""
+Measures generated forms under concurrent requests, as on a ``threadsafe``
+App Engine instance.
+
+Worker threads each handle requests that generate a form with
+``model_form()``, then construct, validate and render it. The forms hold a
+``KeyPropertyField`` loading its choices from a ``MemoryBackend`` with
+simulated latency. For each number of threads, the throughput, the request
+latencies and the choice queries fetched while the same query was already in
+flight are printed as JSON. The throughput is the median of ``--repeat``
+runs::
+
+    python benchmarks/concurrency.py --threads 1 4 16 --latency 0.02
+
+The ``single_flight`` variant wraps the backend in a ``SingleFlightBackend``,
+which shares the concurrent fetches of a query.
+"""
+import collections
+import statistics
+import threading
+import time
+
+import common
+
+THREADS = [1, 2, 4, 8, 16, 32]
+
+
+def make_models():
+    from google.appengine.ext import ndb
+
+    class ConcurrencyAuthor(ndb.Model):
+        name = ndb.StringProperty()
+
+    class ConcurrencyBook(ndb.Model):
+        title = ndb.StringProperty(required=True)
+        pages = ndb.IntegerProperty()
+        tags = ndb.StringProperty(repeated=True)
+        author = ndb.KeyProperty(kind=ConcurrencyAuthor)
+
+    return ConcurrencyAuthor, ConcurrencyBook
+
+
+class CountingBackend:
+    """
+    Wraps a backend to count its fetches, and the fetches started while the
+    same query was already being fetched.
+    """
+
+    def __init__(self, backend):
+        from wtforms_appengine.choices import query_fingerprint
+
+        self.backend = backend
+        self.fingerprint = query_fingerprint
+        self.fetches = 0
+        self.duplicated = 0
+        self._lock = threading.Lock()
+        self._in_flight = collections.Counter()
+
+    def query(self, model, **scope):
+        return self.backend.query(model, **scope)
+
+    def fetch(self, query, **options):
+        key = self.fingerprint(query, **options)
+        with self._lock:
+            self.fetches += 1
+            if self._in_flight[key]:
+                self.duplicated += 1
+            self._in_flight[key] += 1
+        try:
+            return self.backend.fetch(query, **options)
+        finally:
+            with self._lock:
+                self._in_flight[key] -= 1
+
+    def fetch_async(self, query, **options):
+        return self.backend.fetch_async(query, **options)
+
+    def get_multi(self, keys):
+        return self.backend.get_multi(keys)
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def handle_request(model, backend, data):
+    """
+    Generates, constructs, validates and renders a form, returning its HTML.
+    """
+    from wtforms_appengine.ndb import model_form
+
+    form_class = model_form(model, field_args={"author": {"backend": backend}})
+    form = form_class(common.FormData(data))
+    if not form.validate():
+        raise AssertionError(form.errors)
+    return "".join(field() for field in form)
+
+
+def load(threads, requests, model, backend, data):
+    """
+    Runs ``requests`` requests in each of ``threads`` threads, started
+    together. Returns the total seconds and the latency of each request.
+    """
+    latencies = []
+    errors = []
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        timings = []
+        barrier.wait()
+        try:
+            for _ in range(requests):
+                start = time.perf_counter()
+                handle_request(model, backend, data)
+                timings.append(time.perf_counter() - start)
+        except Exception as exc:
+            errors.append(exc)
+        latencies.extend(timings)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    if errors:
+        raise errors[0]
+    return seconds, latencies
+
+
+def run(thread_counts, repeat, requests, latency, choices):
+    from wtforms_appengine.backends import MemoryBackend
+    from wtforms_appengine.choices import SingleFlight
+    from wtforms_appengine.choices import SingleFlightBackend
+    from wtforms_appengine.fields import KeyPropertyField
+
+    common.activate_testbed()
+    author_model, book_model = make_models()
+
+    store = MemoryBackend(latency=latency)
+    authors = [author_model(name="Author %d" % i) for i in range(choices)]
+    store.put_multi(authors)
+    data = {
+        "title": "A title",
+        "pages": "120",
+        "tags": "fiction\nclassic",
+        "author": KeyPropertyField._key_value(authors[-1].key),
+    }
+
+    results = []
+    for threads in thread_counts:
+        for variant in ("plain", "single_flight"):
+            counter = CountingBackend(store)
+            backend = counter
+            if variant == "single_flight":
+                backend = SingleFlightBackend(counter, group=SingleFlight())
+
+            runs = [
+                load(threads, requests, book_model, backend, data)
+                for _ in range(repeat)
+            ]
+            throughputs = [len(latencies) / seconds for seconds, latencies in runs]
+            ordered = sorted(x for _, latencies in runs for x in latencies)
+            results.append(
+                {
+                    "case": "model_form.request",
+                    "params": {
+                        "threads": threads,
+                        "variant": variant,
+                        "latency": latency,
+                        "choices": choices,
+                    },
+                    "throughput": statistics.median(throughputs),
+                    "seconds": {
+                        "p50": percentile(ordered, 0.5),
+                        "p99": percentile(ordered, 0.99),
+                        "max": ordered[-1],
+                    },
+                    "queries": {
+                        "fetches": counter.fetches,
+                        "duplicated": counter.duplicated,
+                        "per_request": counter.fetches / len(ordered),
+                    },
+                }
+            )
+    return results
+
+
+def main(argv=None):
+    parser = common.argument_parser(__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, nargs="+", default=THREADS)
+    parser.add_argument(
+        "--requests", type=int, default=50, help="number of requests per thread"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.01,
+        help="simulated datastore latency, in seconds",
+    )
+    parser.add_argument(
+        "--choices", type=int, default=100, help="number of referenced entities"
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.threads, args.repeat, args.requests, args.latency, args.choices)
+    common.write_report("concurrency", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
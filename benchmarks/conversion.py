@@ -0,0 +1,143 @@
+"""
+Measures the cost of generating form classes from models.
+
+``model_form()``, ``model_fields()`` and ``ModelConverter.convert()`` are
+timed for ``ndb`` and ``db`` models with 5, 50 and 500 properties of mixed
+types, with and without the ``only``, ``exclude`` and ``field_args``
+options. The results are printed as JSON::
+
+    python benchmarks/conversion.py --widths 5 50 --output conversion.json
+
+With ``--memory``, the memory retained by each generated form class and by
+each form instance is measured too.
+"""
+import functools
+
+import common
+
+from wtforms_appengine import db as appengine_db
+from wtforms_appengine import ndb as appengine_ndb
+
+WIDTHS = [5, 50, 500]
+
+
+def property_names(library, model):
+    if library == "ndb":
+        return list(model._properties)
+    return list(model.properties())
+
+
+def option_variants(names):
+    """
+    Returns the ``model_form()`` options timed for each model, by variant
+    name.
+    """
+    return {
+        "all": {},
+        "only": {"only": names[:5]},
+        "exclude": {"exclude": names[::2]},
+        "field_args": {
+            "field_args": {
+                name: {"label": name.upper(), "description": "Field %s" % name}
+                for name in names
+            }
+        },
+    }
+
+
+def convert_all(library, model):
+    """Returns a callable converting every property of ``model`` in turn."""
+    converter = (appengine_ndb if library == "ndb" else appengine_db).ModelConverter()
+    if library == "ndb":
+        props = list(model._properties.values())
+    else:
+        props = list(model.properties().values())
+
+    def convert():
+        for prop in props:
+            converter.convert(model, prop, None)
+
+    return convert
+
+
+def memory_results(library, module, model, width):
+    """
+    Returns the results measuring the memory of a generated form class and
+    of an unbound instance of it.
+    """
+    form_class = module.model_form(model)
+    return [
+        {
+            "case": "%s.model_form" % library,
+            "params": {"width": width, "variant": "form_class"},
+            "memory": common.measure_memory(lambda: module.model_form(model), 10),
+        },
+        {
+            "case": "%s.form" % library,
+            "params": {"width": width, "variant": "instance"},
+            "memory": common.measure_memory(form_class, 10),
+        },
+    ]
+
+
+def run(widths, repeat, memory=False):
+    results = []
+    for library, module, make_model in (
+        ("ndb", appengine_ndb, common.ndb_model),
+        ("db", appengine_db, common.db_model),
+    ):
+        for width in widths:
+            model = make_model(width)
+            names = property_names(library, model)
+
+            for variant, options in option_variants(names).items():
+                results.append(
+                    {
+                        "case": "%s.model_form" % library,
+                        "params": {"width": width, "variant": variant},
+                        "seconds": common.time_calls(
+                            functools.partial(module.model_form, model, **options),
+                            repeat,
+                        ),
+                    }
+                )
+
+            results.append(
+                {
+                    "case": "%s.model_fields" % library,
+                    "params": {"width": width, "variant": "all"},
+                    "seconds": common.time_calls(
+                        functools.partial(module.model_fields, model), repeat
+                    ),
+                }
+            )
+
+            seconds = common.time_calls(convert_all(library, model), repeat)
+            per_property = {
+                k: v / width if k in ("median", "min", "max") else v
+                for k, v in seconds.items()
+            }
+            results.append(
+                {
+                    "case": "%s.ModelConverter.convert" % library,
+                    "params": {"width": width, "variant": "per_property"},
+                    "seconds": per_property,
+                }
+            )
+
+            if memory:
+                results.extend(memory_results(library, module, model, width))
+    return results
+
+
+def main(argv=None):
+    parser = common.argument_parser(__doc__.splitlines()[1], memory=True)
+    parser.add_argument("--widths", type=int, nargs="+", default=WIDTHS)
+    args = parser.parse_args(argv)
+
+    results = run(args.widths, args.repeat, args.memory)
+    common.write_report("conversion", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
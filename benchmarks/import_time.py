@@ -0,0 +1,190 @@
+"""
+Measures the cold-start cost of importing the package.
+
+Every module is imported in a fresh interpreter, the way it happens on a new
+App Engine instance. For each module, the report has the import time, the
+memory it allocated, the per-module breakdown of ``python -X importtime``,
+and, for ``wtforms_appengine.ndb`` and ``wtforms_appengine.db``, the time to
+generate a first form. The results are printed as JSON::
+
+    python benchmarks/import_time.py --runs 20 --output import_time.json
+"""
+import argparse
+import collections
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+import common
+
+MODULES = [
+    "wtforms_appengine",
+    "wtforms_appengine.fields",
+    "wtforms_appengine.ndb",
+    "wtforms_appengine.db",
+]
+
+# Imports a module, measuring its time and memory, then generates a first
+# form with it if a model is given.
+IMPORT_SCRIPT = """
+import json
+import resource
+import sys
+import time
+import tracemalloc
+
+module, model_source = sys.argv[1:3]
+trace = "--trace" in sys.argv
+if trace:
+    tracemalloc.start()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+start = time.perf_counter()
+__import__(module)
+result = {
+    "seconds": time.perf_counter() - start,
+    "rss_growth": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) * 1024,
+    "loaded": sorted(m for m in sys.modules if m.startswith("wtforms_appengine")),
+}
+if trace:
+    result["traced"], result["traced_peak"] = tracemalloc.get_traced_memory()
+
+if model_source:
+    namespace = {}
+    exec(model_source, namespace)
+    model_form = sys.modules[module].model_form
+    for name in ("first_form", "second_form"):
+        start = time.perf_counter()
+        model_form(namespace["Model"])
+        result[name] = time.perf_counter() - start
+
+print(json.dumps(result))
+"""
+
+# The models given a first form, by module.
+FORM_MODELS = {
+    "wtforms_appengine.ndb": """
+from google.appengine.ext import ndb
+
+class Author(ndb.Model):
+    name = ndb.StringProperty()
+
+class Model(ndb.Model):
+    title = ndb.StringProperty(required=True)
+    pages = ndb.IntegerProperty()
+    published = ndb.DateTimeProperty()
+    summary = ndb.TextProperty()
+    tags = ndb.StringProperty(repeated=True)
+    author = ndb.KeyProperty(kind=Author)
+""",
+    "wtforms_appengine.db": """
+from google.appengine.ext import db
+
+class Author(db.Model):
+    name = db.StringProperty()
+
+class Model(db.Model):
+    title = db.StringProperty(required=True)
+    pages = db.IntegerProperty()
+    published = db.DateTimeProperty()
+    summary = db.TextProperty()
+    tags = db.StringListProperty()
+    author = db.ReferenceProperty(Author)
+""",
+}
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_script(module, *args):
+    env = dict(os.environ, PYTHONPATH=common.BASE_DIR)
+    source = FORM_MODELS.get(module, "")
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SCRIPT, module, source] + list(args), env=env
+    )
+    return json.loads(output)
+
+
+def import_breakdown(module, runs):
+    """
+    Imports ``module`` with ``-X importtime`` in ``runs`` fresh interpreters,
+    returning the median ``self`` and ``cumulative`` seconds of every module
+    it imported, in import order, with its nesting ``depth``.
+    """
+    env = dict(os.environ, PYTHONPATH=common.BASE_DIR)
+    timings = collections.defaultdict(list)
+    depths = {}
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import " + module],
+            env=env,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        ).stderr
+        for match in IMPORTTIME_LINE.finditer(output):
+            self_us, cumulative_us, indent, name = match.groups()
+            timings[name].append((int(self_us), int(cumulative_us)))
+            depths[name] = len(indent) // 2
+
+    return [
+        {
+            "module": name,
+            "depth": depths[name],
+            "self": statistics.median(x[0] for x in values) / 10 ** 6,
+            "cumulative": statistics.median(x[1] for x in values) / 10 ** 6,
+        }
+        for name, values in timings.items()
+    ]
+
+
+def measure_module(module, runs):
+    """
+    Imports ``module`` in ``runs`` fresh interpreters, and once more with
+    ``tracemalloc``, returning its result.
+    """
+    results = [run_script(module) for _ in range(runs)]
+    traced = run_script(module, "--trace")
+    timings = [x["seconds"] for x in results]
+
+    result = {
+        "case": "import",
+        "params": {"module": module},
+        "seconds": {
+            "median": statistics.median(timings),
+            "min": min(timings),
+            "max": max(timings),
+            "repeat": runs,
+        },
+        "memory": {
+            "traced": traced["traced"],
+            "traced_peak": traced["traced_peak"],
+            "rss_growth": statistics.median(x["rss_growth"] for x in results),
+        },
+        "loaded": results[-1]["loaded"],
+        "breakdown": import_breakdown(module, runs),
+    }
+    if module in FORM_MODELS:
+        result["form_seconds"] = {
+            name: statistics.median(x[name] for x in results)
+            for name in ("first_form", "second_form")
+        }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", help="file to write the JSON report to")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args(argv)
+
+    results = [measure_module(module, args.runs) for module in args.modules]
+    common.write_report("import_time", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Measures how the reference fields scale with the number of choices.
+
+A ``MemoryBackend`` is filled with 10 to 100k entities, and forms holding a
+``KeyPropertyField``, ``RepeatedKeyPropertyField``,
+``PrefetchedKeyPropertyField`` or ``ReferencePropertyField`` are processed,
+validated and rendered for valid and invalid submissions. The time and the
+datastore calls of each phase are printed as JSON::
+
+    python benchmarks/reference_fields.py --sizes 10 1000 100000
+
+Cases whose time, extrapolated from the growth between the previous sizes,
+would exceed ``--max-seconds`` are reported as skipped, so that super-linear
+cases don't stall the run.
+
+With ``--memory``, the memory retained by a form once its choices are loaded
+is measured too, in total and per choice. The entities are then stored with
+the datastore stub, so each form fetches entities of its own, as it would in
+production.
+"""
+import math
+import statistics
+import time
+
+import common
+
+from wtforms import Form
+
+SIZES = [10, 100, 1000, 10000, 100000]
+
+PHASES = ["process", "validate", "render"]
+
+
+def make_models():
+    from google.appengine.ext import ndb
+
+    class BenchTarget(ndb.Model):
+        name = ndb.StringProperty()
+
+    return BenchTarget, common.db_target_model()
+
+
+def fill(put_multi, model, size, library, start=0):
+    """
+    Stores the entities ``start`` to ``size`` of ``model`` with
+    ``put_multi``, in batches of 500.
+    """
+    if library == "ndb":
+        entities = [model(name="Target %d" % i) for i in range(start, size)]
+    else:
+        entities = [
+            model(key_name="t%d" % i, name="Target %d" % i) for i in range(start, size)
+        ]
+    for start in range(0, len(entities), 500):
+        end = start + 500
+        put_multi(entities[start:end])
+    return entities
+
+
+def make_cases(backend, ndb_model, db_model, ndb_entities, db_entities):
+    """
+    Returns ``(field name, form class, valid data)`` tuples. The valid
+    submissions pick the last choices, the worst case for a linear scan of
+    the choices.
+    """
+    from wtforms_appengine import fields
+
+    def form_class(field_class, model):
+        class BenchForm(Form):
+            target = field_class(
+                reference_class=model, get_label="name", backend=backend
+            )
+
+        return BenchForm
+
+    key_value = fields.KeyPropertyField._key_value
+    last_keys = [key_value(x.key) for x in ndb_entities[-3:]]
+
+    return [
+        (
+            "KeyPropertyField",
+            form_class(fields.KeyPropertyField, ndb_model),
+            last_keys[-1],
+        ),
+        (
+            "RepeatedKeyPropertyField",
+            form_class(fields.RepeatedKeyPropertyField, ndb_model),
+            last_keys,
+        ),
+        (
+            "PrefetchedKeyPropertyField",
+            form_class(fields.PrefetchedKeyPropertyField, ndb_model),
+            last_keys[-1],
+        ),
+        (
+            "ReferencePropertyField",
+            form_class(fields.ReferencePropertyField, db_model),
+            str(db_entities[-1].key()),
+        ),
+    ]
+
+
+def expected_seconds(history, size):
+    """
+    Extrapolates the time of a case at ``size`` from its ``(size, seconds)``
+    history, assuming ``seconds`` grows as a power of the size.
+    """
+    if not history:
+        return 0
+    last_size, last_seconds = history[-1]
+    exponent = 1
+    if len(history) > 1:
+        prev_size, prev_seconds = history[-2]
+        if prev_seconds > 0 and last_seconds > 0:
+            exponent = max(
+                1,
+                math.log(last_seconds / prev_seconds) / math.log(last_size / prev_size),
+            )
+    return last_seconds * (size / last_size) ** exponent
+
+
+def run_phases(form_class, data):
+    """
+    Processes, validates and renders a form, returning the seconds and the
+    datastore calls of each phase.
+    """
+    from wtforms_appengine.instrument import count_rpcs
+
+    seconds = {}
+    rpcs = {}
+    form = None
+
+    def process():
+        nonlocal form
+        form = form_class(common.FormData(target=data))
+
+    steps = {
+        "process": process,
+        "validate": lambda: form.validate(),
+        "render": lambda: str(form.target),
+    }
+    for phase in PHASES:
+        with count_rpcs() as counter:
+            start = time.perf_counter()
+            steps[phase]()
+            seconds[phase] = time.perf_counter() - start
+        rpcs[phase] = dict(counter)
+    return seconds, rpcs
+
+
+def run(sizes, repeat, latency, max_seconds):
+    from wtforms_appengine.backends import MemoryBackend
+
+    common.activate_testbed()
+    ndb_model, db_model = make_models()
+
+    results = []
+    # The (size, seconds) runs of each case.
+    history = {}
+    for size in sorted(sizes):
+        backend = MemoryBackend(latency=latency)
+        ndb_entities = fill(backend.put_multi, ndb_model, size, "ndb")
+        db_entities = fill(backend.put_multi, db_model, size, "db")
+        cases = make_cases(backend, ndb_model, db_model, ndb_entities, db_entities)
+
+        for name, form_class, valid in cases:
+            invalid = "invalid" if isinstance(valid, str) else ["invalid"]
+            for submission, data in (("valid", valid), ("invalid", invalid)):
+                result = {
+                    "case": name,
+                    "params": {
+                        "choices": size,
+                        "submission": submission,
+                        "latency": latency,
+                    },
+                }
+                results.append(result)
+
+                runs = history.setdefault((name, submission), [])
+                if expected_seconds(runs, size) * repeat > max_seconds:
+                    result["skipped"] = True
+                    continue
+
+                measures = [run_phases(form_class, data) for _ in range(repeat)]
+                seconds = {
+                    phase: statistics.median(m[0][phase] for m in measures)
+                    for phase in PHASES
+                }
+                seconds["total"] = sum(seconds.values())
+                result["seconds"] = seconds
+                result["rpcs"] = measures[-1][1]
+                runs.append((size, seconds["total"]))
+    return results
+
+
+def memory_run(sizes):
+    """
+    Measures the memory retained by a validated form, which holds its
+    choices, for each field and number of choices.
+    """
+    from google.appengine.ext import db
+    from google.appengine.ext import ndb
+
+    bed = common.activate_testbed()
+    bed.init_datastore_v3_stub()
+    bed.init_memcache_stub()
+    # Entities from the context cache would be shared between the forms.
+    ndb.get_context().set_cache_policy(False)
+    ndb.get_context().set_memcache_policy(False)
+    ndb_model, db_model = make_models()
+
+    results = []
+    ndb_entities = []
+    db_entities = []
+    for size in sorted(sizes):
+        ndb_entities += fill(ndb.put_multi, ndb_model, size, "ndb", len(ndb_entities))
+        db_entities += fill(db.put, db_model, size, "db", len(db_entities))
+        cases = make_cases(None, ndb_model, db_model, ndb_entities, db_entities)
+
+        for name, form_class, valid in cases:
+
+            def load(form_class=form_class, valid=valid):
+                form = form_class(common.FormData(target=valid))
+                form.validate()
+                return form
+
+            memory = common.measure_memory(load)
+            memory["retained_per_choice"] = memory["retained"] / size
+            results.append(
+                {"case": name, "params": {"choices": size}, "memory": memory}
+            )
+    return results
+
+
+def main(argv=None):
+    parser = common.argument_parser(__doc__.splitlines()[1], memory=True)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0,
+        help="simulated datastore latency, in seconds",
+    )
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=60,
+        help="expected time above which a case is skipped",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat, args.latency, args.max_seconds)
+    if args.memory:
+        results.extend(memory_run(args.sizes))
+    common.write_report("reference_fields", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
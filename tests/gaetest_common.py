@@ -12,10 +12,13 @@ BASE_DIR = os.path.abspath(os.path.join(my_dir, ".."))
 if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
+import contextlib
 from unittest import TestCase
 
 from google.appengine.ext import ndb, testbed
 from google.appengine.datastore import datastore_stub_util
+from wtforms_appengine.backends import MemoryBackend
+from wtforms_appengine.instrument import count_rpcs
 
 
 SAMPLE_AUTHORS = (
@@ -33,22 +36,55 @@ class DummyPostData(dict):
         return v
 
 
-def fill_authors(Author):
+def fill_authors(Author, backend=None):
     """
     Fill authors from SAMPLE_AUTHORS.
     Model is passed so it can be either an NDB or DB model.
+    If a backend is passed, the authors are stored in it instead of the
+    datastore.
     """
     AGE_BASE = 30
     authors = []
     for name, city in SAMPLE_AUTHORS:
         author = Author(name=name, city=city, age=AGE_BASE)
-        author.put()
+        if backend is not None:
+            backend.put(author)
+        else:
+            author.put()
         authors.append(author)
         AGE_BASE += 1
     return authors
 
 
-class NDBTestCase(TestCase):
+class RPCBudgetMixin:
+    @contextlib.contextmanager
+    def assertRPCBudget(self, total=None, **budget):
+        """
+        Fails if the block makes more datastore RPCs than budgeted, e.g.
+        ``assertRPCBudget(query=1)``. Kinds of RPCs (``query``, ``get``,
+        ``put``, ...) that aren't given are allowed none, unless a ``total``
+        is given, which then limits all of them together.
+        """
+        with count_rpcs() as rpcs:
+            yield rpcs
+
+        lines = []
+        exceeded = total is not None and sum(rpcs.values()) > total
+        for kind in sorted(set(budget) | set(rpcs)):
+            limit = budget.get(kind, 0 if total is None else None)
+            over = limit is not None and rpcs[kind] > limit
+            exceeded = exceeded or over
+            line = "  %s%s: %d" % ("! " if over else "  ", kind, rpcs[kind])
+            if limit is not None:
+                line += " (budget %d)" % limit
+            lines.append(line)
+        if exceeded:
+            if total is not None:
+                lines.append("    total: %d (budget %d)" % (sum(rpcs.values()), total))
+            self.fail("Datastore RPC budget exceeded:\n" + "\n".join(lines))
+
+
+class NDBTestCase(RPCBudgetMixin, TestCase):
     def setUp(self):
         self.testbed = testbed.Testbed()
         self.testbed.activate()
@@ -64,7 +100,7 @@ class NDBTestCase(TestCase):
         self.testbed.deactivate()
 
 
-class DBTestCase(TestCase):
+class DBTestCase(RPCBudgetMixin, TestCase):
     def setUp(self):
         self.testbed = testbed.Testbed()
         self.testbed.activate()
@@ -74,3 +110,20 @@ class DBTestCase(TestCase):
 
     def tearDown(self):
         self.testbed.deactivate()
+
+
+class MemoryTestCase(RPCBudgetMixin, TestCase):
+    """
+    Runs the fields against an in-memory backend, without the datastore stub.
+    """
+
+    latency = 0
+
+    def setUp(self):
+        # Only sets up the environment, no service stubs are needed.
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.backend = MemoryBackend(latency=self.latency)
+
+    def tearDown(self):
+        self.testbed.deactivate()
@@ -0,0 +1,143 @@
+import time
+
+from wtforms_appengine.backends import MemoryBackend
+from wtforms_appengine.fields import KeyPropertyField
+from wtforms_appengine.fields import PrefetchedKeyPropertyField
+from wtforms_appengine.fields import RepeatedKeyPropertyField
+from wtforms_appengine.ndb import model_form
+
+from google.appengine.ext import db
+from wtforms import Form
+
+from .gaetest_common import DummyPostData
+from .gaetest_common import fill_authors
+from .gaetest_common import MemoryTestCase
+from .test_ndb import Author
+from .test_ndb import Book
+
+
+class TestMemoryBackend(MemoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authors = fill_authors(Author, self.backend)
+
+    def test_key_field(self):
+        class F(Form):
+            author = KeyPropertyField(reference_class=Author, backend=self.backend)
+
+        key = self.authors[1].key
+        form = F(DummyPostData(author=KeyPropertyField._key_value(key)))
+        assert form.validate(), form.errors
+        self.assertEqual(form.author.data, key)
+        self.assertEqual(
+            [x[1] for x in form.author.iter_choices()],
+            [str(x) for x in self.authors],
+        )
+        self.assertEqual(self.backend.calls["fetch"], 1)
+
+    def test_repeated_key_field(self):
+        class F(Form):
+            authors = RepeatedKeyPropertyField(
+                reference_class=Author, backend=self.backend
+            )
+
+        keys = [x.key for x in self.authors[:2]]
+        form = F(DummyPostData(authors=[KeyPropertyField._key_value(k) for k in keys]))
+        assert form.validate(), form.errors
+        self.assertEqual(form.authors.data, keys)
+
+    def test_model_form(self):
+        form_class = model_form(Book, field_args={"author": {"backend": self.backend}})
+        form = form_class(DummyPostData(author="__None"))
+        assert form.validate(), form.errors
+        self.assertEqual(len(list(form.author.iter_choices())), 4)
+
+    def test_query_options(self):
+        options = []
+
+        class Backend(MemoryBackend):
+            def fetch(self, query, **kwargs):
+                options.append(kwargs)
+                return super().fetch(query, **kwargs)
+
+            def fetch_async(self, query, **kwargs):
+                options.append(kwargs)
+                return super().fetch_async(query, **kwargs)
+
+        class F(Form):
+            a = KeyPropertyField(
+                reference_class=Author,
+                query_options={"batch_size": 50},
+                backend=Backend(),
+            )
+            b = PrefetchedKeyPropertyField(
+                reference_class=Author,
+                query_options={"use_cache": False},
+                backend=Backend(),
+            )
+
+        form = F()
+        form.a.query
+        self.assertEqual(options, [{"use_cache": False}, {"batch_size": 50}])
+
+    def test_scoped_query(self):
+        query = self.backend.query(
+            Author,
+            filters=[Author.city.IN(["Boston", "London"])],
+            order=[-Author.name],
+        )
+        self.assertEqual([x.name for x in query], ["Linda", "Bob"])
+
+        parent = self.authors[0].key
+        child = Author(parent=parent, name="Junior", age=1)
+        self.backend.put(child)
+        self.assertEqual(
+            list(self.backend.query(Author, ancestor=parent)),
+            [
+                self.authors[0],
+                child,
+            ],
+        )
+
+    def test_scoped_db_query(self):
+        class DBReader(db.Model):
+            name = db.StringProperty()
+
+        self.backend.put(DBReader(key_name="bob", name="Bob"))
+        self.assertEqual([x.name for x in self.backend.query(DBReader)], ["Bob"])
+        self.assertRaises(
+            TypeError, self.backend.query, DBReader, filters=[("name =", "Bob")]
+        )
+
+    def test_get_multi(self):
+        keys = [x.key for x in self.authors]
+        self.assertEqual(self.backend.get_multi(keys[::-1]), self.authors[::-1])
+
+
+class TestMemoryBackendLatency(MemoryTestCase):
+    latency = 0.05
+
+    def test_latency(self):
+        fill_authors(Author, self.backend)
+        query = self.backend.query(Author)
+
+        start = time.perf_counter()
+        self.assertEqual(len(query.fetch()), 3)
+        self.assertGreaterEqual(time.perf_counter() - start, self.latency)
+
+    def test_prefetch_overlaps(self):
+        fill_authors(Author, self.backend)
+
+        class F(Form):
+            a = PrefetchedKeyPropertyField(reference_class=Author, backend=self.backend)
+            b = PrefetchedKeyPropertyField(reference_class=Author, backend=self.backend)
+
+        start = time.perf_counter()
+        form = F()
+        self.assertEqual(len(form.a.query) + len(form.b.query), 6)
+        self.assertLess(time.perf_counter() - start, 2 * self.latency)
+        self.assertEqual(self.backend.calls["fetch_async"], 2)
+
+    def test_independent_backends(self):
+        backend = MemoryBackend()
+        self.assertEqual(list(backend.query(Author)), [])
@@ -0,0 +1,137 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from wtforms_appengine import db as db_forms
+from wtforms_appengine import ndb as ndb_forms
+from wtforms_appengine.fields import BlobUploadField
+from wtforms_appengine.fields import BytesWriter
+from wtforms_appengine.fields import LocalFileWriter
+
+from google.appengine.ext import db
+from google.appengine.ext import ndb
+from wtforms import FileField
+from wtforms import Form
+
+from .gaetest_common import DBTestCase
+from .gaetest_common import DummyPostData
+from .gaetest_common import NDBTestCase
+
+
+class Upload:
+    """Mimics the ``FileStorage`` objects web frameworks put in formdata."""
+
+    def __init__(self, content):
+        self.stream = io.BytesIO(content)
+
+
+class Attachment(ndb.Model):
+    name = ndb.StringProperty()
+    blob_key = ndb.BlobKeyProperty()
+
+
+class DBAttachment(db.Model):
+    name = db.StringProperty()
+    content = db.BlobProperty()
+
+
+class BlobKeyWriter(BytesWriter):
+    """Stands in for a blobstore writer, returning a ``BlobKey``."""
+
+    def close(self):
+        return ndb.BlobKey("blob-%d" % len(super().close()))
+
+
+class TestBlobUploadField(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        class F(Form):
+            blob = BlobUploadField(
+                max_size=100,
+                chunk_size=16,
+                writer=lambda: LocalFileWriter(self.directory),
+            )
+
+        self.F = F
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_spooled_to_writer(self):
+        content = b"x" * 90
+        form = self.F(DummyPostData(blob=Upload(content)))
+        assert form.validate(), form.errors
+
+        self.assertEqual(form.blob.size, 90)
+        with open(os.path.join(self.directory, form.blob.data), "rb") as fp:
+            self.assertEqual(fp.read(), content)
+
+    def test_too_large(self):
+        form = self.F(DummyPostData(blob=Upload(b"x" * 101)))
+        self.assertFalse(form.validate())
+        self.assertEqual(form.blob.data, None)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_default_writer(self):
+        class F(Form):
+            blob = BlobUploadField()
+
+        form = F(DummyPostData(blob=Upload(b"data")))
+        self.assertEqual(form.blob.data.read(), b"data")
+        form.blob.data.close()
+
+    def test_populate_obj(self):
+        class Obj:
+            blob = "existing"
+
+        obj = Obj()
+        self.F(DummyPostData(blob="")).populate_obj(obj)
+        self.assertEqual(obj.blob, "existing")
+
+        form = self.F(DummyPostData(blob=Upload(b"data")))
+        form.populate_obj(obj)
+        self.assertEqual(obj.blob, form.blob.data)
+
+
+class TestNDBModelForm(NDBTestCase):
+    def test_file_field_without_writer(self):
+        form = ndb_forms.model_form(Attachment)()
+        self.assertEqual(type(form.blob_key), FileField)
+
+    def test_populate_obj(self):
+        form_class = ndb_forms.model_form(
+            Attachment, field_args={"blob_key": {"writer": BlobKeyWriter}}
+        )
+        form = form_class(DummyPostData(name="a", blob_key=Upload(b"data")))
+        assert form.validate(), form.errors
+
+        entity = Attachment()
+        form.populate_obj(entity)
+        self.assertEqual(entity.blob_key, ndb.BlobKey("blob-4"))
+        entity.put()
+
+
+class TestDBModelForm(DBTestCase):
+    def test_populate_obj(self):
+        form_class = db_forms.model_form(DBAttachment)
+        form = form_class(DummyPostData(name="a", content=Upload(b"data")))
+        assert form.validate(), form.errors
+
+        entity = DBAttachment()
+        form.populate_obj(entity)
+        self.assertEqual(entity.content, b"data")
+        entity.put()
+
+        form = form_class(DummyPostData(name="a", content=""))
+        form.populate_obj(entity)
+        self.assertEqual(entity.content, b"data")
+
+    def test_max_size(self):
+        form_class = db_forms.model_form(DBAttachment)
+        content = Upload(b"x" * (1024 * 1024 + 1))
+        form = form_class(DummyPostData(name="a", content=content))
+        self.assertFalse(form.validate())
+        self.assertEqual(form.content.data, None)
@@ -0,0 +1,391 @@
+import threading
+import time
+from unittest import TestCase
+
+from wtforms_appengine.backends import MemoryBackend
+from wtforms_appengine.backends import NDBBackend
+from wtforms_appengine.choices import IncrementalChoicesBackend
+from wtforms_appengine.choices import query_fingerprint
+from wtforms_appengine.choices import SingleFlight
+from wtforms_appengine.choices import SingleFlightBackend
+from wtforms_appengine.choices import StaleWhileRevalidateBackend
+from wtforms_appengine.fields import KeyPropertyField
+from wtforms_appengine.fields import PrefetchedKeyPropertyField
+
+from google.appengine.ext import ndb
+from wtforms import Form
+
+from .gaetest_common import DummyPostData
+from .gaetest_common import fill_authors
+from .gaetest_common import MemoryTestCase
+from .gaetest_common import NDBTestCase
+from .test_ndb import Author
+
+
+def run_threads(count, func):
+    """Runs ``func`` in ``count`` threads, returning results or errors."""
+    results = [None] * count
+
+    def target(i):
+        try:
+            results[i] = func()
+        except Exception as exc:
+            results[i] = exc
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestSingleFlight(TestCase):
+    def test_shared_result(self):
+        group = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.05)
+            return object()
+
+        results = run_threads(5, lambda: group.do("key", slow))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(x is results[0] for x in results))
+        self.assertEqual(group.in_flight(), 0)
+
+    def test_shared_error(self):
+        group = SingleFlight()
+        calls = []
+
+        def failing():
+            calls.append(1)
+            time.sleep(0.05)
+            raise ValueError("datastore error")
+
+        results = run_threads(3, lambda: group.do("key", failing))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(x, ValueError) for x in results))
+
+        # Errors aren't kept, the next call runs again.
+        self.assertEqual(group.do("key", lambda: 1), 1)
+
+    def test_timeout(self):
+        group = SingleFlight(timeout=0.01)
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            time.sleep(0.1)
+            return 1
+
+        leader = threading.Thread(target=group.do, args=("key", slow))
+        leader.start()
+        started.wait()
+        self.assertRaises(TimeoutError, group.do, "key", slow)
+        leader.join()
+
+
+class TestSingleFlightBackend(MemoryTestCase):
+    latency = 0.05
+
+    def setUp(self):
+        super().setUp()
+        self.authors = fill_authors(Author, self.backend)
+        self.single_flight = SingleFlightBackend(self.backend, SingleFlight())
+
+    def test_concurrent_fields(self):
+        class F(Form):
+            author = KeyPropertyField(
+                reference_class=Author, backend=self.single_flight
+            )
+
+        results = run_threads(5, lambda: F().author.query)
+        self.assertEqual(self.backend.calls["fetch"], 1)
+        for result in results:
+            self.assertEqual(result, self.authors)
+
+    def test_different_options(self):
+        query = self.backend.query(Author)
+        run_threads(
+            2,
+            lambda: self.single_flight.fetch(query, limit=threading.get_ident()),
+        )
+        self.assertEqual(self.backend.calls["fetch"], 2)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            query_fingerprint(Author.query().order(Author.name)),
+            query_fingerprint(Author.query().order(Author.name)),
+        )
+        self.assertNotEqual(
+            query_fingerprint(Author.query().order(Author.name)),
+            query_fingerprint(Author.query().order(-Author.name)),
+        )
+        self.assertNotEqual(
+            query_fingerprint(Author.query(), limit=1),
+            query_fingerprint(Author.query(), limit=2),
+        )
+
+
+class FailingBackend(MemoryBackend):
+    def fetch(self, query, **options):
+        if self.fail:
+            raise ValueError("datastore error")
+        return super().fetch(query, **options)
+
+
+class ConcurrencyBackend(MemoryBackend):
+    """Records the largest number of fetches running at once."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def fetch(self, query, **options):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            return super().fetch(query, **options)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+class TestStaleWhileRevalidateBackend(MemoryTestCase):
+    latency = 0.05
+
+    def setUp(self):
+        super().setUp()
+        fill_authors(Author, self.backend)
+        self.swr = StaleWhileRevalidateBackend(self.backend, deadline=0.01)
+        self.query = self.backend.query(Author)
+
+    def wait_refreshes(self):
+        while self.swr._refreshes:
+            time.sleep(0.01)
+
+    def test_deadline(self):
+        self.assertEqual(len(self.swr.fetch(self.query)), 3)
+        self.assertEqual(self.swr.stats["miss"], 1)
+
+        self.backend.put(Author(name="Jim"))
+        start = time.perf_counter()
+        self.assertEqual(len(self.swr.fetch(self.query)), 3)
+        self.assertLess(time.perf_counter() - start, self.latency)
+        self.assertEqual(self.swr.stats["stale"], 1)
+
+        # The refresh completes in the background.
+        self.wait_refreshes()
+        self.assertEqual(len(self.swr.fetch(self.query)), 4)
+        self.assertEqual(self.backend.calls["fetch"], 3)
+
+    def test_refreshed(self):
+        self.swr.deadline = 1
+        self.swr.fetch(self.query)
+        self.swr.fetch(self.query)
+        self.assertEqual(self.swr.stats["refreshed"], 1)
+
+    def test_max_age(self):
+        self.swr.max_age = 60
+        self.swr.fetch(self.query)
+        self.swr.fetch(self.query)
+        self.assertEqual(self.swr.stats["hit"], 1)
+        self.assertEqual(self.backend.calls["fetch"], 1)
+
+    def test_error(self):
+        backend = FailingBackend(latency=self.latency)
+        backend.fail = False
+        fill_authors(Author, backend)
+        swr = StaleWhileRevalidateBackend(backend, deadline=1)
+        query = backend.query(Author)
+        self.assertEqual(len(swr.fetch(query)), 3)
+
+        backend.fail = True
+        self.assertEqual(len(swr.fetch(query)), 3)
+        self.assertEqual(swr.stats["error"], 1)
+        self.assertEqual(swr.stats["stale"], 1)
+
+        swr._results.clear()
+        self.assertRaises(ValueError, swr.fetch, query)
+
+    def test_max_queries(self):
+        swr = StaleWhileRevalidateBackend(self.backend, max_queries=2)
+        queries = [
+            self.backend.query(Author, filters=[Author.name == name])
+            for name in ("Bob", "Harry", "Linda")
+        ]
+        for query in queries + queries[:1]:
+            swr.fetch(query)
+
+        self.assertEqual(
+            list(swr._results),
+            [query_fingerprint(queries[2]), query_fingerprint(queries[0])],
+        )
+
+    def test_max_refreshes(self):
+        backend = ConcurrencyBackend(latency=0.02)
+        fill_authors(Author, backend)
+        swr = StaleWhileRevalidateBackend(backend, max_refreshes=2)
+        futures = [swr.fetch_async(backend.query(Author), limit=i) for i in range(1, 7)]
+        self.assertEqual([len(x.get_result()) for x in futures], [1, 2, 3, 3, 3, 3])
+        self.assertEqual(backend.max_running, 2)
+
+    def test_prefetched_field(self):
+        class F(Form):
+            author = PrefetchedKeyPropertyField(
+                reference_class=Author, backend=self.swr
+            )
+
+        self.assertEqual(len(F().author.query), 3)
+        self.backend.put(Author(name="Jim"))
+        form = F()
+        self.assertEqual(len(form.author.query), 3)
+        self.assertEqual(len(form.author.query), 3)
+        self.assertEqual(self.swr.stats["stale"], 1)
+
+
+class TestStaleWhileRevalidateNDB(NDBTestCase):
+    def test_refresh_sees_writes(self):
+        authors = fill_authors(Author)
+        swr = StaleWhileRevalidateBackend(NDBBackend(), max_refreshes=1)
+        query = Author.query().order(Author.name)
+        self.assertEqual([x.name for x in swr.fetch(query)], ["Bob", "Harry", "Linda"])
+
+        authors[0].name = "Robert"
+        authors[0].put()
+        self.assertEqual(
+            [x.name for x in swr.fetch(query)], ["Harry", "Linda", "Robert"]
+        )
+        self.assertEqual(swr.stats["refreshed"], 1)
+
+
+class Publisher(ndb.Model):
+    name = ndb.StringProperty()
+    city = ndb.StringProperty()
+
+
+class TestIncrementalChoicesBackend(NDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = IncrementalChoicesBackend(NDBBackend())
+        self.backend.register(Publisher)
+        self.addCleanup(self.backend.unregister, Publisher)
+        ndb.put_multi(
+            [
+                Publisher(name="Bob", city="Boston"),
+                Publisher(name="Linda", city="London"),
+            ]
+        )
+
+    def names(self, query, **options):
+        return [x.name for x in self.backend.fetch(query, **options)]
+
+    def test_writes(self):
+        query = Publisher.query().order(Publisher.name)
+        self.assertEqual(self.names(query), ["Bob", "Linda"])
+
+        with self.assertRPCBudget(put=2, delete=1):
+            harry = Publisher(name="Harry", city="Houston")
+            harry.put()
+            self.assertEqual(self.names(query), ["Bob", "Harry", "Linda"])
+
+            harry.name = "Adam"
+            harry.put()
+            self.assertEqual(self.names(query), ["Adam", "Bob", "Linda"])
+
+            harry.key.delete()
+            self.assertEqual(self.names(query), ["Bob", "Linda"])
+
+        self.assertEqual(self.backend.stats["miss"], 1)
+        self.assertEqual(self.backend.stats["updated"], 3)
+        self.assertEqual(self.names(query), [x.name for x in query])
+
+    def test_unsaved_changes(self):
+        query = Publisher.query().order(Publisher.name)
+        self.backend.fetch(query)
+
+        harry = Publisher(name="Harry")
+        harry.put()
+        harry.name = "Harry (unsaved draft)"
+        self.assertEqual(self.names(query), ["Bob", "Harry", "Linda"])
+
+    def test_own_delete_hook(self):
+        deleted = []
+
+        class Imprint(ndb.Model):
+            name = ndb.StringProperty()
+
+            @classmethod
+            def _post_delete_hook(cls, key, future):
+                deleted.append(cls)
+
+        class SmallImprint(Imprint):
+            pass
+
+        self.backend.register(Imprint)
+        self.addCleanup(self.backend.unregister, Imprint)
+        key = Imprint(name="Ink").put()
+        future = key.delete_async()
+        future.get_result()
+        self.assertEqual(deleted, [Imprint])
+
+        SmallImprint._post_delete_hook(key, future)
+        self.assertEqual(deleted, [Imprint, SmallImprint])
+
+    def test_filters(self):
+        query = Publisher.query(Publisher.city == "Boston")
+        self.assertEqual(self.names(query), ["Bob"])
+
+        bob = query.get()
+        bob.city = "Berlin"
+        with self.assertRPCBudget(put=2):
+            bob.put()
+            Publisher(name="Jim", city="Boston").put()
+            self.assertEqual(self.names(query), ["Jim"])
+
+    def test_partial_results(self):
+        query = Publisher.query().order(Publisher.name)
+        self.assertEqual(self.names(query, limit=1), ["Bob"])
+
+        Publisher(name="Adam").put()
+        self.assertEqual(self.backend.stats["dropped"], 1)
+        with self.assertRPCBudget(query=1):
+            self.assertEqual(self.names(query, limit=1), ["Adam"])
+
+    def test_transaction(self):
+        query = Publisher.query()
+        self.backend.fetch(query)
+
+        @ndb.transactional
+        def put():
+            Publisher(name="Jim").put()
+            self.assertEqual(len(self.backend.fetch(query)), 2)
+            raise ndb.Rollback()
+
+        put()
+        self.assertEqual(len(self.backend.fetch(query)), 2)
+        self.assertEqual(self.backend.stats["updated"], 0)
+
+    def test_unregistered(self):
+        self.backend.fetch(Author.query())
+        with self.assertRPCBudget(query=1):
+            self.backend.fetch(Author.query())
+
+    def test_field(self):
+        class F(Form):
+            publisher = PrefetchedKeyPropertyField(
+                reference_class=Publisher, get_label="name", backend=self.backend
+            )
+
+        self.assertEqual(len(F().publisher.query), 2)
+        key = Publisher(name="Jim").put()
+
+        with self.assertRPCBudget():
+            form = F(DummyPostData(publisher=key.urlsafe()))
+            self.assertTrue(form.validate())
+            self.assertIn("Jim", str(form.publisher))
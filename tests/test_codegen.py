@@ -0,0 +1,79 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+
+from wtforms_appengine import codegen
+from wtforms_appengine.ndb import model_form
+
+from wtforms import validators
+
+from .gaetest_common import NDBTestCase
+from .test_ndb import Author
+from .test_ndb import Book
+
+SPECS = [
+    (Author, {}),
+    (Book, {"name": "BookAuthorForm", "field_args": {"author": {"label": "By"}}}),
+]
+
+
+def describe(form):
+    """Returns the field types, labels and validators of a bound form."""
+    return [
+        (
+            field.name,
+            type(field),
+            field.label.text,
+            [(type(v), vars(v)) for v in field.validators],
+        )
+        for field in form
+    ]
+
+
+class TestCodegen(NDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "generated_forms.py")
+        with open(self.path, "w") as fp:
+            fp.write(codegen.generate_module(SPECS))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def load(self):
+        spec = importlib.util.spec_from_file_location("generated_forms", self.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+
+    def test_same_fields(self):
+        module = self.load()
+
+        self.assertEqual(describe(module.AuthorForm()), describe(model_form(Author)()))
+        expected = model_form(Book, field_args={"author": {"label": "By"}})
+        self.assertEqual(describe(module.BookAuthorForm()), describe(expected()))
+
+    def test_check(self):
+        self.assertEqual(codegen.check_module(self.path, SPECS), "")
+
+        diff = codegen.check_module(self.path, SPECS + [(Book, {})])
+        self.assertIn("+class BookForm(Form):", diff)
+
+    def test_duplicate_names(self):
+        self.assertRaises(ValueError, codegen.generate_module, [(Book, {}), (Book, {})])
+
+    def test_unreadable_arguments(self):
+        writer = codegen.ModuleWriter()
+        self.assertEqual(writer.literal(validators.Optional()), "Optional()")
+        self.assertRaises(
+            ValueError, writer.literal, validators.Optional(strip_whitespace=False)
+        )
+
+    def test_unimportable_functions(self):
+        writer = codegen.ModuleWriter()
+        self.assertEqual(writer.literal(describe), "describe")
+        self.assertRaises(ValueError, writer.literal, lambda form, field: None)
+        self.assertRaises(ValueError, writer.literal, self.load)
@@ -23,6 +23,7 @@ from wtforms import validators
 from .gaetest_common import DBTestCase
 from .gaetest_common import DummyPostData
 from .gaetest_common import fill_authors
+from .gaetest_common import MemoryTestCase
 
 
 class Author(db.Model):
@@ -36,6 +37,16 @@ class Book(db.Model):
     author = db.ReferenceProperty(Author)
 
 
+class UpperStringProperty(db.StringProperty):
+    def get_value_for_datastore(self, model_instance):
+        value = super().get_value_for_datastore(model_instance)
+        return value and value.upper()
+
+
+class Note(db.Model):
+    title = UpperStringProperty()
+
+
 class AllPropertiesModel(db.Model):
     """Property names are ugly, yes."""
 
@@ -185,6 +196,10 @@ class TestModelForm(DBTestCase):
         self.assertEqual(hasattr(form_class, "prop_user"), False)
         self.assertEqual(hasattr(form_class, "prop_im"), False)
 
+    def test_property_subclass(self):
+        form = model_form(Note)()
+        self.assertEqual(type(form.title), f.StringField)
+
     def test_populate_form(self):
         entity = Author(
             key_name="test", name="John", city="Yukon", age=25, is_admin=True
@@ -298,6 +313,13 @@ class TestReferencePropertyField(DBTestCase):
         assert form.validate()
         self.assertEqual(set(form.author.iter_choices()), self.author_expected(0))
 
+    def test_rpc_budget(self):
+        F = self.build_form(get_label="name")
+        with self.assertRPCBudget(query=1):
+            form = F(DummyPostData(author=str(self.authors[0].key())))
+            assert form.validate()
+            str(form.author)
+
     def test_not_in_query(self):
         F = self.build_form()
         new_author = Author(name="Jim", age=48)
@@ -326,6 +348,26 @@ class TestReferencePropertyField(DBTestCase):
         self.assertEqual(set(form.author.iter_choices()), expected)
 
 
+class TestReferencePropertyFieldMemory(MemoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authors = [
+            Author(key_name=name, name=name, age=30) for name in ["foo", "bar"]
+        ]
+        self.backend.put_multi(self.authors)
+
+    def test_basic(self):
+        class F(Form):
+            author = ReferencePropertyField(
+                reference_class=Author, get_label="name", backend=self.backend
+            )
+
+        form = F(DummyPostData(author=str(self.authors[1].key())))
+        assert form.validate()
+        self.assertEqual(form.author.data.name, "bar")
+        self.assertEqual([x[1] for x in form.author.iter_choices()], ["foo", "bar"])
+
+
 class TestStringListPropertyField(TestCase):
     class F(Form):
         a = StringListPropertyField()
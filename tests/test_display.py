@@ -0,0 +1,108 @@
+import datetime
+
+from wtforms_appengine.display import DisplayRenderer
+
+from google.appengine.ext import db
+from google.appengine.ext import ndb
+
+from .gaetest_common import DBTestCase
+from .gaetest_common import fill_authors
+from .gaetest_common import MemoryTestCase
+from .test_ndb import Author
+from .test_ndb import Book
+from .test_ndb import Collab
+
+
+class Event(ndb.Model):
+    name = ndb.StringProperty()
+    starts = ndb.DateTimeProperty()
+    tags = ndb.StringProperty(repeated=True)
+    extra = ndb.JsonProperty()
+
+
+class DBSpeaker(db.Model):
+    name = db.StringProperty()
+
+
+class ShoutedProperty(db.StringProperty):
+    def get_value_for_datastore(self, model_instance):
+        value = super().get_value_for_datastore(model_instance)
+        return value and value.upper()
+
+
+class DBTalk(db.Model):
+    title = ShoutedProperty()
+    day = db.DateProperty()
+    speaker = db.ReferenceProperty(DBSpeaker)
+
+
+class TestDisplayRenderer(MemoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authors = fill_authors(Author, self.backend)
+
+    def test_labels(self):
+        renderer = DisplayRenderer(
+            Author,
+            only=["name", "genre", "address"],
+            field_args={"name": {"label": "Full name"}},
+        )
+        # Structured properties are not displayed.
+        self.assertEqual(renderer.labels, [("name", "Full name"), ("genre", "Genre")])
+
+    def test_formatting(self):
+        renderer = DisplayRenderer(Event)
+        event = Event(
+            name="Launch",
+            starts=datetime.datetime(2020, 1, 2, 3, 4, 5),
+            tags=["a", "b"],
+            extra={"x": 1},
+        )
+        row = renderer.row(event)
+        self.assertEqual(
+            list(row),
+            [
+                ("Name", "Launch"),
+                ("Starts", "2020-01-02 03:04:05"),
+                ("Tags", "a, b"),
+                ("Extra", '{"x": 1}'),
+            ],
+        )
+        self.assertEqual(renderer.row(Event())["starts"], "")
+
+    def test_batched_references(self):
+        books = [Book(author=author.key) for author in self.authors] + [Book()]
+        renderer = DisplayRenderer(
+            Book,
+            field_args={"author": {"get_label": "name"}},
+            backend=self.backend,
+        )
+
+        rows = renderer.rows(books)
+        self.assertEqual([x["author"] for x in rows], ["Bob", "Harry", "Linda", ""])
+        self.assertEqual(self.backend.calls["get"], 1)
+        self.assertEqual(self.backend.calls["fetch"], 0)
+
+    def test_repeated_references(self):
+        collab = Collab(authors=[x.key for x in self.authors[:2]])
+        renderer = DisplayRenderer(
+            Collab,
+            field_args={"authors": {"get_label": "name"}},
+            backend=self.backend,
+        )
+        self.assertEqual(renderer.row(collab)["authors"], "Bob, Harry")
+
+
+class TestDBDisplayRenderer(DBTestCase):
+    def test_model_values(self):
+        speaker = DBSpeaker(name="Ann")
+        speaker.put()
+        talk = DBTalk(title="Intro", day=datetime.date(2020, 1, 2), speaker=speaker)
+        renderer = DisplayRenderer(
+            DBTalk, field_args={"speaker": {"get_label": "name"}}
+        )
+
+        row = renderer.row(talk)
+        self.assertEqual(row["title"], "Intro")
+        self.assertEqual(row["day"], "2020-01-02")
+        self.assertEqual(row["speaker"], "Ann")
@@ -0,0 +1,55 @@
+import json
+import subprocess
+import sys
+from unittest import skipIf
+from unittest import TestCase
+
+from .gaetest_common import BASE_DIR
+
+LOADED_SCRIPT = """
+import json
+import sys
+import {module}
+print(json.dumps(sorted(m for m in sys.modules if m.startswith("wtforms_appengine"))))
+"""
+
+
+def loaded_modules(module):
+    """
+    Imports ``module`` in a fresh interpreter, returning the package modules
+    it pulled in.
+    """
+    output = subprocess.check_output(
+        [sys.executable, "-c", LOADED_SCRIPT.format(module=module)], cwd=BASE_DIR
+    )
+    return json.loads(output)
+
+
+class TestLazyImports(TestCase):
+    @skipIf(sys.version_info < (3, 7), "Python 3.6 imports every field module")
+    def test_ndb_skips_db(self):
+        loaded = loaded_modules("wtforms_appengine.ndb")
+        self.assertIn("wtforms_appengine.fields.ndb", loaded)
+        self.assertNotIn("wtforms_appengine.fields.db", loaded)
+        self.assertNotIn("wtforms_appengine.db", loaded)
+
+    def test_fields_skip_choices(self):
+        loaded = loaded_modules("wtforms_appengine.ndb")
+        self.assertIn("wtforms_appengine.stats", loaded)
+        self.assertNotIn("wtforms_appengine.choices", loaded)
+
+    @skipIf(sys.version_info < (3, 7), "Python 3.6 imports every field module")
+    def test_db_skips_ndb(self):
+        loaded = loaded_modules("wtforms_appengine.db")
+        self.assertIn("wtforms_appengine.fields.db", loaded)
+        self.assertNotIn("wtforms_appengine.fields.ndb", loaded)
+        self.assertNotIn("wtforms_appengine.ndb", loaded)
+
+    def test_public_names(self):
+        from wtforms_appengine import fields
+        from wtforms_appengine.fields import db
+
+        for name in fields.__all__:
+            self.assertTrue(hasattr(fields, name), name)
+        self.assertIs(fields.StringListPropertyField, db.StringListPropertyField)
+        self.assertRaises(AttributeError, getattr, fields, "NoSuchField")
@@ -0,0 +1,126 @@
+from wtforms_appengine.fields import KeyPropertyField
+from wtforms_appengine.instrument import count_rpcs
+from wtforms_appengine.instrument import InstrumentedForm
+from wtforms_appengine.instrument import Observer
+from wtforms_appengine.instrument import set_observer
+from wtforms_appengine.ndb import model_form
+
+from .gaetest_common import DummyPostData
+from .gaetest_common import fill_authors
+from .gaetest_common import MemoryTestCase
+from .gaetest_common import NDBTestCase
+from .test_ndb import Author
+from .test_ndb import Book
+
+
+class RecordingObserver(Observer):
+    def __init__(self):
+        self.generated = []
+        self.forms = []
+        self.fields = []
+
+    def form_generated(self, model, form_class, seconds):
+        self.generated.append(model)
+
+    def form_phase(self, form, phase, seconds, rpcs):
+        self.forms.append((phase, dict(rpcs)))
+
+    def field_phase(self, form, field, phase, seconds, rpcs):
+        self.fields.append((field.name, phase, dict(rpcs)))
+
+
+class TestInstrumentedForm(NDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authors = fill_authors(Author)
+        self.observer = RecordingObserver()
+        set_observer(self.observer)
+
+    def tearDown(self):
+        set_observer(None)
+        super().tearDown()
+
+    def test_phases(self):
+        form_class = model_form(Book, base_class=InstrumentedForm)
+        self.assertEqual(self.observer.generated, [Book])
+
+        key = self.authors[0].key
+        form = form_class(DummyPostData(author=KeyPropertyField._key_value(key)))
+        assert form.validate(), form.errors
+        form.author()
+        form.populate_obj(Book())
+
+        self.assertEqual(
+            self.observer.forms,
+            [
+                ("process", {}),
+                ("init", {}),
+                ("validate", {"query": 1}),
+                ("populate_obj", {}),
+            ],
+        )
+        # The choice query is attributed to the field's pre_validate.
+        self.assertEqual(
+            self.observer.fields,
+            [
+                ("author", "bind", {}),
+                ("author", "process", {}),
+                ("author", "pre_validate", {"query": 1}),
+                ("author", "validate", {"query": 1}),
+                ("author", "render", {}),
+                ("author", "populate_obj", {}),
+            ],
+        )
+
+    def test_no_observer(self):
+        set_observer(None)
+        form = model_form(Book, base_class=InstrumentedForm)()
+        form.validate()
+        self.assertNotIn("validate", vars(form.author))
+        self.assertEqual(self.observer.forms, [])
+        self.assertEqual(self.observer.generated, [])
+
+
+class TestCountRpcs(NDBTestCase):
+    def test_datastore(self):
+        with count_rpcs() as outer:
+            authors = fill_authors(Author)
+            with count_rpcs() as inner:
+                Author.query().fetch()
+                authors[0].key.get()
+        self.assertEqual(inner, {"query": 1, "get": 1})
+        self.assertEqual(outer, {"put": 3, "query": 1, "get": 1})
+
+
+class TestCountRpcsMemory(MemoryTestCase):
+    def test_memory_backend(self):
+        with count_rpcs() as rpcs:
+            authors = fill_authors(Author, self.backend)
+            self.backend.query(Author).fetch()
+            self.backend.get_multi([x.key for x in authors])
+        self.assertEqual(rpcs, {"put": 3, "query": 1, "get": 1})
+
+
+class TestRPCBudget(NDBTestCase):
+    def test_within_budget(self):
+        with self.assertRPCBudget(put=3, query=1):
+            fill_authors(Author)
+            Author.query().fetch()
+
+        with self.assertRPCBudget(total=4):
+            fill_authors(Author)
+            Author.query().fetch()
+
+    def test_exceeded(self):
+        with self.assertRaises(AssertionError) as cm:
+            with self.assertRPCBudget(query=1):
+                fill_authors(Author)
+                Author.query().fetch()
+                Author.query().fetch()
+
+        self.assertEqual(
+            str(cm.exception),
+            "Datastore RPC budget exceeded:\n"
+            "  ! put: 3 (budget 0)\n"
+            "  ! query: 2 (budget 1)",
+        )
@@ -1,20 +1,24 @@
 from itertools import product
 from wtforms_appengine.fields import JsonPropertyField
+from wtforms_appengine.fields import KeyChoice
 from wtforms_appengine.fields import KeyPropertyField
 from wtforms_appengine.fields import PrefetchedKeyPropertyField
 from wtforms_appengine.fields import RepeatedKeyPropertyField
 from wtforms_appengine.fields import RepeatedPrefetchedKeyPropertyField
+from wtforms_appengine.fields import StructuredPropertyField
 from wtforms_appengine.ndb import model_form
+from wtforms_appengine.ndb import ModelConverter
+from wtforms_appengine.ndb import ModelConverterBase
 
 from google.appengine.ext import ndb
 from wtforms import BooleanField
 from wtforms import FieldList
 from wtforms import Form
-from wtforms import FormField
 from wtforms import IntegerField
 from wtforms import SelectField
 from wtforms import SelectMultipleField
 from wtforms import StringField
+from wtforms import validators
 
 from . import second_ndb_module
 from .gaetest_common import DummyPostData
@@ -85,6 +89,16 @@ class Book(ndb.Model):
     author = ndb.KeyProperty(kind=Author)
 
 
+class UpperStringProperty(ndb.StringProperty):
+    def _to_base_type(self, value):
+        return value.upper()
+
+
+class Note(ndb.Model):
+    title = UpperStringProperty()
+    body = ndb.BlobProperty()
+
+
 class Collab(ndb.Model):
     authors = ndb.KeyProperty(kind=Author, repeated=True)
 
@@ -181,7 +195,77 @@ class TestKeyPropertyField(NDBTestCase):
             assert data_form.validate()
 
             instance = data_form["empty"].data.get()
-            self.assertEqual(instance, choice_label)
+            self.assertEqual(str(instance), choice_label)
+
+    def test_rpc_budget(self):
+        data = DummyPostData(author=KeyPropertyField._key_value(self.first_author_key))
+        with self.assertRPCBudget(query=1):
+            form = self.F(data)
+            assert form.validate(), form.errors
+            str(form.author)
+            form.populate_obj(Book())
+
+    def test_scoped_query(self):
+        AncestorModel.generate()
+        parent = ndb.Key(AncestorModel, 1)
+
+        class F(Form):
+            child = KeyPropertyField(
+                reference_class=AncestorModel,
+                ancestor=lambda: parent,
+                query_filters=[AncestorModel.sort > 0],
+                query_order=[-AncestorModel.sort],
+            )
+
+        query = F().child.query
+        self.assertEqual([x.sort for x in query], [3, 2, 1])
+        self.assertTrue(all(x.key.parent() == parent for x in query))
+
+        form = model_form(
+            Book,
+            field_args={
+                "author": {
+                    "query_filters": [Author.city != "Houston"],
+                    "query_order": [-Author.city],
+                }
+            },
+        )()
+        self.assertEqual([x.name for x in form.author.query], ["Linda", "Bob"])
+
+    def test_query_options(self):
+        class F(Form):
+            author = KeyPropertyField(
+                reference_class=Author,
+                query_options={
+                    "read_policy": ndb.EVENTUAL_CONSISTENCY,
+                    "batch_size": 1,
+                    "use_cache": False,
+                },
+            )
+
+        self.assertEqual(len(F().author.query), len(self.authors))
+
+    def test_compact_choices(self):
+        field_class = self.F.author.field_class
+
+        class F(Form):
+            author = field_class(
+                reference_class=Author, get_label="name", compact_choices=True
+            )
+
+        class Full(Form):
+            author = field_class(reference_class=Author, get_label="name")
+
+        data = DummyPostData(author=KeyPropertyField._key_value(self.first_author_key))
+        form = F(data)
+        assert form.validate(), form.errors
+        self.assertEqual(form.author.data, self.first_author_key)
+        self.assertTrue(all(type(x) is KeyChoice for x in form.author.query))
+        self.assertEqual(
+            list(form.author.iter_choices()), list(Full(data).author.iter_choices())
+        )
+
+        self.assertFalse(F(DummyPostData(author="fooflaf")).validate())
 
 
 class TestRepeatedKeyPropertyField(NDBTestCase):
@@ -254,8 +338,31 @@ class TestRepeatedKeyPropertyField(NDBTestCase):
         # What should the data of an invalid field be?
         # self.assertEqual(form.authors.data, None)
 
+    def test_compact_choices(self):
+        field_class = type(self.get_form().authors)
+
+        class F(Form):
+            authors = field_class(
+                reference_class=Author, get_label="name", compact_choices=True
+            )
+
+        key = self.first_author_key
+        form = F(DummyPostData(authors=[RepeatedKeyPropertyField._key_value(key)]))
+        assert form.validate(), form.errors
+        self.assertEqual(form.authors.data, [key])
+        self.assertTrue(all(type(x) is KeyChoice for x in form.authors.query))
+        self.assertEqual(
+            sorted(
+                (label, selected) for _, label, selected in form.authors.iter_choices()
+            ),
+            sorted((x.name, x.key == key) for x in self.authors),
+        )
+
 
 class TestPrefetchedKeyPropertyField(TestKeyPropertyField):
+    class F(Form):
+        author = PrefetchedKeyPropertyField(reference_class=Author)
+
     def get_form(self, *args, **kwargs):
         q = Author.query().order(Author.name)
 
@@ -302,7 +409,7 @@ class TestModelForm(NDBTestCase):
         ("is_admin", BooleanField),
         ("genre", SelectField),
         ("genres", SelectMultipleField),
-        ("address", FormField),
+        ("address", StructuredPropertyField),
         ("address_history", FieldList),
     ]
 
@@ -332,6 +439,79 @@ class TestModelForm(NDBTestCase):
         for key, _, _ in form().author.iter_choices():
             keys.add(key)
 
+    def test_deferred_kind(self):
+        """
+        The referenced kind only has to be imported when the form is used, not
+        when it is generated.
+        """
+
+        class LateBook(ndb.Model):
+            author = ndb.KeyProperty(kind="LateAuthor")
+
+        form_class = model_form(LateBook)
+        self.assertTrue(hasattr(form_class, "author"))
+
+        class LateAuthor(ndb.Model):
+            name = ndb.StringProperty()
+
+        key = LateAuthor(name="Late").put()
+
+        form = form_class()
+        self.assertIs(form.author.reference_class, LateAuthor)
+        self.assertEqual([x.key for x in form.author.query], [key])
+
+    def test_property_subclass(self):
+        form = model_form(Note)()
+        self.assertEqual(type(form.title), StringField)
+        # BlobProperty has no converter, and is skipped.
+        self.assertFalse(hasattr(form, "body"))
+
+    def test_converter_dispatch(self):
+        class Converter(ModelConverter):
+            def convert_UpperStringProperty(self, model, prop, kwargs):
+                return IntegerField(**kwargs)
+
+        self.assertIn("UpperStringProperty", Converter._converter_methods)
+        self.assertNotIn("UpperStringProperty", ModelConverter._converter_methods)
+
+        form = model_form(Note, converter=Converter())()
+        self.assertEqual(type(form.title), IntegerField)
+
+        converter = ModelConverter({"StringProperty": lambda *args: None})
+        self.assertFalse(hasattr(model_form(Note, converter=converter), "title"))
+
+        base = ModelConverterBase()
+        self.assertEqual(
+            base.get_converter(ndb.StringProperty), base.fallback_converter
+        )
+
+    def test_converters_dict(self):
+        def convert_age(model, prop, kwargs):
+            return None
+
+        converter = ModelConverter({"IntegerProperty": convert_age})
+        self.assertEqual(
+            converter.converters["StringProperty"], converter.convert_StringProperty
+        )
+        self.assertIs(converter.converters["IntegerProperty"], convert_age)
+
+        converter.converters["StringProperty"] = lambda model, prop, kwargs: None
+        self.assertFalse(hasattr(model_form(Note, converter=converter), "title"))
+
+    def test_query_options(self):
+        converter = ModelConverter(query_options={"use_cache": False})
+        form = model_form(Collab, converter=converter)()
+        self.assertEqual(form.authors.query_options, {"use_cache": False})
+
+        form = model_form(
+            Book,
+            converter=converter,
+            field_args={"author": {"query_options": {"batch_size": 10}}},
+        )()
+        self.assertEqual(form.author.query_options, {"batch_size": 10})
+
+        self.assertEqual(model_form(Book)().author.query_options, {})
+
     def test_choices(self):
         form = model_form(Author)
         bound_form = form()
@@ -361,3 +541,83 @@ class TestModelForm(NDBTestCase):
         # For provided choices, they should be in the provided order
         self.assertEqual(bound_form["genres"].choices, expected)
         self.assertEqual(bound_form["name"].choices, expected)
+
+
+class TestStructuredProperty(NDBTestCase):
+    def test_subform_cached(self):
+        form_a = model_form(Author)
+        form_b = model_form(Author, only=["address", "address_history"])
+
+        self.assertIs(form_a.address.args[0], form_b.address_history.args[0].args[0])
+        self.assertIs(form_a.address.args[0], form_b.address.args[0])
+
+    def test_subform_converters(self):
+        converter = ModelConverter(
+            {"StringProperty": lambda model, prop, kwargs: IntegerField(**kwargs)}
+        )
+        form = model_form(Author, only=["address"], converter=converter)()
+        self.assertEqual(type(form.address.city), IntegerField)
+
+        form = model_form(Author, only=["address"])()
+        self.assertEqual(type(form.address.city), StringField)
+
+    def test_subform_options(self):
+        form = model_form(
+            Author,
+            field_args={"address": {"only": ["city"]}},
+        )()
+        self.assertEqual([x.name for x in form.address], ["address-city"])
+
+    def test_subform_not_cached_with_objects(self):
+        field_args = {"address": {"field_args": {"city": {"validators": []}}}}
+        form_a = model_form(Author, only=["address"], field_args=field_args)
+        form_b = model_form(Author, only=["address"], field_args=field_args)
+        self.assertIs(form_a.address.args[0], form_b.address.args[0])
+
+        def field_args():
+            check = validators.length(max=3)
+            return {"address": {"field_args": {"city": {"validators": [check]}}}}
+
+        form_a = model_form(Author, only=["address"], field_args=field_args())
+        form_b = model_form(Author, only=["address"], field_args=field_args())
+        self.assertIsNot(form_a.address.args[0], form_b.address.args[0])
+
+    def test_validators(self):
+        class Publisher(ndb.Model):
+            address = ndb.StructuredProperty(Address, required=True)
+
+        def no_london(form, field):
+            if field.data["city"] == "London":
+                raise validators.ValidationError("Not London")
+
+        form_class = model_form(
+            Publisher, field_args={"address": {"validators": [no_london]}}
+        )
+        form = form_class(DummyPostData({"address-city": "London"}))
+        self.assertTrue(form.address.flags.required)
+        self.assertFalse(form.validate())
+        self.assertEqual(form.errors, {"address": ["Not London"]})
+
+        form = form_class(DummyPostData({"address-city": "Boston"}))
+        assert form.validate(), form.errors
+
+    def test_populate_obj(self):
+        form_class = model_form(Author, only=["address", "address_history"])
+        form = form_class(
+            DummyPostData(
+                {
+                    "address-city": "Boston",
+                    "address_history-0-city": "Houston",
+                    "address_history-1-city": "London",
+                }
+            )
+        )
+        assert form.validate(), form.errors
+
+        author = Author()
+        form.populate_obj(author)
+        self.assertIsInstance(author.address, Address)
+        self.assertEqual(author.address.city, "Boston")
+        self.assertEqual(
+            [x.city for x in author.address_history], ["Houston", "London"]
+        )
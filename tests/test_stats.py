@@ -0,0 +1,112 @@
+from wtforms_appengine import stats
+from wtforms_appengine.fields import KeyPropertyField
+from wtforms_appengine.fields import PrefetchedKeyPropertyField
+
+from wtforms import Form
+
+from .gaetest_common import fill_authors
+from .gaetest_common import MemoryTestCase
+from .test_ndb import Author
+
+
+class TestQueryStats(MemoryTestCase):
+    def setUp(self):
+        super().setUp()
+        fill_authors(Author, self.backend)
+        stats.registry.reset()
+        stats.registry.enabled = True
+        self.addCleanup(stats.registry.reset)
+        self.addCleanup(setattr, stats.registry, "enabled", False)
+
+    def test_fields_recorded(self):
+        class F(Form):
+            a = KeyPropertyField(reference_class=Author, backend=self.backend)
+            b = PrefetchedKeyPropertyField(
+                reference_class=Author,
+                query_options={"limit": 2},
+                backend=self.backend,
+            )
+
+        for _ in range(3):
+            form = F()
+            form.a.query
+            form.b.query
+            form.b.query
+
+        snapshot = stats.snapshot()
+        self.assertEqual(
+            sorted(snapshot),
+            ["MemoryQuery(kind='Author')", "MemoryQuery(kind='Author') [('limit', 2)]"],
+        )
+
+        a = snapshot["MemoryQuery(kind='Author')"]
+        self.assertEqual(a["runs"], 3)
+        self.assertEqual(a["results"], 9)
+        self.assertEqual(a["last_results"], 3)
+        self.assertGreater(a["entity_bytes"], 0)
+        self.assertEqual(a["bytes_fetched"], 9 * a["entity_bytes"])
+        self.assertLessEqual(a["latency_p50"], a["latency_max"])
+
+        # The prefetched field records each fetch once.
+        b = snapshot["MemoryQuery(kind='Author') [('limit', 2)]"]
+        self.assertEqual(b["runs"], 3)
+        self.assertEqual(b["max_results"], 2)
+
+    def test_percentiles(self):
+        registry = stats.StatsRegistry(max_samples=100)
+        query = self.backend.query(Author)
+        for i in range(200):
+            registry.record(query, {}, [], i / 1000)
+
+        result = registry.snapshot()["MemoryQuery(kind='Author')"]
+        self.assertEqual(result["runs"], 200)
+        self.assertEqual(result["entity_bytes"], None)
+        self.assertEqual(result["latency_p50"], 0.15)
+        self.assertEqual(result["latency_p99"], 0.199)
+        self.assertEqual(result["latency_max"], 0.199)
+
+    def test_disabled(self):
+        stats.registry.enabled = False
+
+        class F(Form):
+            a = KeyPropertyField(reference_class=Author, backend=self.backend)
+            b = PrefetchedKeyPropertyField(reference_class=Author, backend=self.backend)
+
+        form = F()
+        self.assertEqual(len(form.a.query), 3)
+        self.assertEqual(len(form.b.query), 3)
+        self.assertEqual(stats.snapshot(), {})
+
+    def test_max_queries(self):
+        registry = stats.StatsRegistry(max_queries=2)
+        queries = [
+            self.backend.query(Author, filters=[Author.age == i]) for i in range(3)
+        ]
+        registry.record(queries[0], {}, [], 0)
+        registry.record(queries[1], {}, [], 0)
+        registry.record(queries[0], {}, [], 0)
+        registry.record(queries[2], {}, [], 0)
+
+        self.assertEqual(registry.evicted, 1)
+        self.assertEqual(
+            sorted(x["runs"] for x in registry.snapshot().values()), [1, 2]
+        )
+
+    def test_size_sample(self):
+        registry = stats.StatsRegistry(size_sample=2)
+        query = self.backend.query(Author)
+        authors = self.backend.fetch(query)
+        registry.record(query, {}, authors * 100, 0)
+
+        result = registry.snapshot()["MemoryQuery(kind='Author')"]
+        self.assertGreater(result["entity_bytes"], 0)
+        self.assertEqual(result["bytes_fetched"], 300 * result["entity_bytes"])
+
+    def test_keys_only(self):
+        registry = stats.StatsRegistry()
+        query = self.backend.query(Author)
+        keys = [author.key for author in self.backend.fetch(query)]
+        registry.record(query, {"keys_only": True}, keys, 0)
+
+        result = registry.snapshot()["MemoryQuery(kind='Author') [('keys_only', True)]"]
+        self.assertEqual(result["entity_bytes"], keys[0].reference().ByteSize())
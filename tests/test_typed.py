@@ -0,0 +1,123 @@
+import json
+from wtforms_appengine.fields import IntegerListPropertyField
+from wtforms_appengine.fields import JsonPropertyField
+from wtforms_appengine.fields import StringListPropertyField
+from wtforms_appengine.ndb import model_form
+from wtforms_appengine.typed import TypedForm
+from wtforms_appengine.typed import TypedInput
+
+from google.appengine.ext import ndb
+from wtforms import Form
+
+from .gaetest_common import fill_authors
+from .gaetest_common import NDBTestCase
+from .test_ndb import Address
+from .test_ndb import Author
+from .test_ndb import Collab
+
+
+class Profile(ndb.Model):
+    name = ndb.StringProperty(required=True)
+    tags = ndb.StringProperty(repeated=True)
+    scores = ndb.IntegerProperty(repeated=True)
+    settings = ndb.JsonProperty()
+    mentor = ndb.KeyProperty(kind=Author)
+
+
+class TestTypedForm(NDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authors = fill_authors(Author)
+        self.ProfileForm = model_form(Profile, base_class=TypedForm)
+
+    def test_typed_values(self):
+        form = self.ProfileForm(
+            {
+                "name": "Ann",
+                "tags": ["a", "b c"],
+                "scores": [1, 2],
+                "settings": {"theme": "dark", "sizes": [1, 2]},
+                "mentor": self.authors[1].key,
+            }
+        )
+        assert form.validate(), form.errors
+
+        profile = Profile()
+        form.populate_obj(profile)
+        self.assertEqual(profile.name, "Ann")
+        self.assertEqual(profile.tags, ["a", "b c"])
+        self.assertEqual(profile.scores, [1, 2])
+        self.assertEqual(profile.settings, {"theme": "dark", "sizes": [1, 2]})
+        self.assertEqual(profile.mentor, self.authors[1].key)
+
+    def test_invalid_values(self):
+        form = self.ProfileForm({"scores": [1, "one"]})
+        self.assertFalse(form.validate())
+        self.assertEqual(set(form.errors), {"name", "scores"})
+
+    def test_empty_values(self):
+        form = self.ProfileForm({"name": "Ann", "tags": [], "settings": None})
+        assert form.validate(), form.errors
+        self.assertEqual(form.tags.data, [])
+        self.assertIsNone(form.settings.data)
+        self.assertIsNone(form.mentor.data)
+
+    def test_urlsafe_keys(self):
+        form_class = model_form(Collab, base_class=TypedForm)
+        keys = [self.authors[0].key, self.authors[2].key]
+        tokens = [key.urlsafe().decode() for key in keys]
+        form = form_class(json.loads(json.dumps({"authors": tokens})))
+        assert form.validate(), form.errors
+        self.assertEqual(form.authors.data, keys)
+
+        form = self.ProfileForm(
+            json.loads(json.dumps({"name": "Ann", "mentor": tokens[1]}))
+        )
+        assert form.validate(), form.errors
+        self.assertEqual(form.mentor.data, keys[1])
+
+        form = form_class({"authors": [tokens[0], keys[1]]})
+        assert form.validate(), form.errors
+        self.assertEqual(form.authors.data, keys)
+
+    def test_nested(self):
+        form_class = model_form(
+            Author, base_class=TypedForm, only=["address", "address_history", "genres"]
+        )
+        form = form_class(
+            {
+                "address": {"city": "Boston"},
+                "address_history": [{"city": "Houston"}, {"city": "London"}],
+                "genres": ["sci-fi", "other"],
+            }
+        )
+        assert form.validate(), form.errors
+
+        author = Author()
+        form.populate_obj(author)
+        self.assertIsInstance(author.address, Address)
+        self.assertEqual(author.address.city, "Boston")
+        self.assertEqual(
+            [x.city for x in author.address_history], ["Houston", "London"]
+        )
+        self.assertEqual(author.genres, ["sci-fi", "other"])
+
+
+class TestTypedInput(NDBTestCase):
+    def test_any_form(self):
+        class F(Form):
+            tags = StringListPropertyField()
+            scores = IntegerListPropertyField()
+            settings = JsonPropertyField()
+
+        form = F(TypedInput({"tags": ["a"], "scores": [3], "settings": [1]}))
+        self.assertEqual(form.data, {"tags": ["a"], "scores": [3], "settings": [1]})
+
+    def test_text_values(self):
+        class F(TypedForm):
+            tags = StringListPropertyField()
+            settings = JsonPropertyField()
+
+        form = F({"tags": "a\nb", "settings": '{"a": 1}'})
+        self.assertEqual(form.tags.data, ["a", "b"])
+        self.assertEqual(form.settings.data, '{"a": 1}')
@@ -0,0 +1,113 @@
+from wtforms_appengine.fields import KeyPropertyField
+from wtforms_appengine.fields import PrefetchedKeyPropertyField
+from wtforms_appengine.ndb import model_form
+from wtforms_appengine.validation import FailFastForm
+from wtforms_appengine.validation import uses_datastore
+
+from google.appengine.ext import ndb
+from wtforms import fields
+from wtforms import Form
+from wtforms import validators
+
+from .gaetest_common import DummyPostData
+from .gaetest_common import fill_authors
+from .gaetest_common import NDBTestCase
+from .test_ndb import Author
+
+
+class Review(ndb.Model):
+    author = ndb.KeyProperty(kind=Author)
+    title = ndb.StringProperty(required=True)
+    reviewers = ndb.KeyProperty(kind=Author, repeated=True)
+
+
+class TestFailFastForm(NDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authors = fill_authors(Author)
+        self.ReviewForm = model_form(Review, base_class=FailFastForm)
+
+    def post_data(self, **data):
+        key = KeyPropertyField._key_value(self.authors[0].key)
+        values = {"author": key, "reviewers": [key]}
+        values.update(data)
+        return DummyPostData(values)
+
+    def test_valid(self):
+        form = self.ReviewForm(self.post_data(title="A review"))
+        with self.assertRPCBudget(query=2):
+            assert form.validate(), form.errors
+        self.assertEqual(form.skipped_fields, ())
+
+    def test_skips_datastore_fields(self):
+        form = self.ReviewForm(self.post_data(reviewers="bad", title=""))
+        with self.assertRPCBudget():
+            self.assertFalse(form.validate())
+        self.assertEqual(list(form.errors), ["title"])
+        self.assertEqual(form.skipped_fields, ("author", "reviewers"))
+
+    def test_collect_all_errors(self):
+        form = self.ReviewForm(self.post_data(reviewers="bad", title=""))
+        with self.assertRPCBudget(query=2):
+            self.assertFalse(form.validate(collect_all_errors=True))
+        self.assertEqual(set(form.errors), {"reviewers", "title"})
+        self.assertEqual(form.skipped_fields, ())
+
+        form_class = model_form(
+            Review, base_class=type("F", (FailFastForm,), {"collect_all_errors": True})
+        )
+        form = form_class(self.post_data(reviewers="bad", title=""))
+        self.assertFalse(form.validate())
+        self.assertEqual(set(form.errors), {"reviewers", "title"})
+
+    def test_prefetched_reads(self):
+        class F(FailFastForm):
+            title = fields.StringField(validators=[validators.required()])
+            author = PrefetchedKeyPropertyField(reference_class=Author)
+
+        # The query is started when the form is built, not by validate().
+        with self.assertRPCBudget(query=1):
+            form = F(self.post_data(title=""))
+            form.author.query
+        with self.assertRPCBudget():
+            self.assertFalse(form.validate())
+
+    def test_repeated_object_reads(self):
+        review = Review(title="A review", reviewers=[self.authors[0].key])
+        with self.assertRPCBudget(get=1):
+            form = self.ReviewForm(self.post_data(title=""), obj=review)
+        with self.assertRPCBudget():
+            self.assertFalse(form.validate())
+
+    def test_inline_validators(self):
+        class F(FailFastForm):
+            name = fields.StringField(validators=[validators.required()])
+            author = KeyPropertyField(reference_class=Author)
+
+            def validate_author(form, field):
+                raise validators.ValidationError("Rejected")
+
+        form = F(self.post_data(name="A name"))
+        self.assertFalse(form.validate({"name": [validators.length(max=3)]}))
+        self.assertEqual(set(form.errors), {"name"})
+        self.assertEqual(form.skipped_fields, ("author",))
+
+        form = F(self.post_data(name="Ann"))
+        self.assertFalse(form.validate())
+        self.assertEqual(form.errors, {"author": ["Rejected"]})
+
+    def test_uses_datastore(self):
+        class Inner(Form):
+            author = KeyPropertyField(reference_class=Author)
+
+        class F(Form):
+            name = fields.StringField()
+            inner = fields.FormField(Inner)
+            authors = fields.FieldList(
+                KeyPropertyField(reference_class=Author), min_entries=1
+            )
+
+        form = F()
+        self.assertFalse(uses_datastore(form.name))
+        self.assertTrue(uses_datastore(form.inner))
+        self.assertTrue(uses_datastore(form.authors))
@@ -0,0 +1,97 @@
+import time
+
+from wtforms_appengine.backends import MemoryBackend
+from wtforms_appengine.backends import NDBBackend
+from wtforms_appengine.choices import StaleWhileRevalidateBackend
+from wtforms_appengine.warmup import WarmupRegistry
+
+from .gaetest_common import fill_authors
+from .gaetest_common import NDBTestCase
+from .test_ndb import Author
+from .test_ndb import Book
+
+
+class SyncFuture:
+    """A future running its query when its result is asked for."""
+
+    def __init__(self, run):
+        self.run = run
+
+    def get_result(self):
+        time.sleep(0.05)
+        return self.run()
+
+
+class SyncBackend(MemoryBackend):
+    def fetch_async(self, query, **options):
+        return SyncFuture(lambda: self.fetch(query, **options))
+
+
+class TestWarmupRegistry(NDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.authors = fill_authors(Author)
+        self.registry = WarmupRegistry()
+        self.registry.register_form("book", Book)
+        self.registry.register_query("names", Author.query().order(Author.name))
+
+    def test_warm(self):
+        report = self.registry.warm()
+
+        self.assertEqual(
+            {(x["name"], x["type"]) for x in report},
+            {("book", "form"), ("names", "query"), ("book.author", "query")},
+        )
+        for item in report:
+            self.assertNotIn("error", item)
+            self.assertGreaterEqual(item["seconds"], 0)
+
+        self.assertEqual(
+            [x.name for x in self.registry.choices["names"]], ["Bob", "Harry", "Linda"]
+        )
+        self.assertEqual(len(self.registry.choices["book.author"]), 3)
+
+    def test_get_form(self):
+        self.registry.warm()
+        form_class = self.registry.get_form("book")
+        self.assertIs(form_class, self.registry.get_form("book"))
+        self.assertIs(form_class.author.kwargs["reference_class"], Author)
+        self.assertEqual(len(list(form_class().author.iter_choices())), 4)
+
+    def test_primes_field_backend(self):
+        backend = StaleWhileRevalidateBackend(NDBBackend(), max_age=60)
+        registry = WarmupRegistry(backend=backend)
+        registry.register_form(
+            "book", Book, field_args={"author": {"query_options": {"limit": 2}}}
+        )
+        registry.warm()
+        self.assertEqual(len(registry.choices["book.author"]), 2)
+
+        with self.assertRPCBudget():
+            form = registry.get_form("book")()
+            self.assertEqual(len(list(form.author.iter_choices())), 3)
+        self.assertEqual(backend.stats["hit"], 1)
+
+    def test_default_backend_refetches(self):
+        self.registry.warm()
+        with self.assertRPCBudget(query=1):
+            form = self.registry.get_form("book")()
+            self.assertEqual(len(list(form.author.iter_choices())), 4)
+
+    def test_query_seconds(self):
+        backend = SyncBackend()
+        fill_authors(Author, backend)
+        registry = WarmupRegistry(backend=backend)
+        for i in range(3):
+            registry.register_query("q%d" % i, backend.query(Author))
+
+        report = registry.warm()
+        self.assertEqual(len(report), 3)
+        for item in report:
+            self.assertLess(item["seconds"], 0.1)
+
+    def test_errors_reported(self):
+        self.registry.register_form("broken", Book, only=["author"], field_args=1)
+        report = {x["name"]: x for x in self.registry.warm()}
+        self.assertIn("error", report["broken"])
+        self.assertNotIn("error", report["book"])
@@ -0,0 +1,308 @@
+"""
+Backends run the datastore calls made by the reference fields.
+
+``KeyPropertyField`` and ``ReferencePropertyField`` build their default query,
+fetch their choices and look up keys through a backend, given with their
+``backend`` argument. ``NDBBackend`` and ``DBBackend`` use the App Engine
+libraries, and ``MemoryBackend`` keeps entities in memory, with a configurable
+simulated RPC latency, for fast tests and repeatable benchmarks:
+
+.. code-block:: python
+
+   backend = MemoryBackend(latency=0.005)
+   backend.put_multi([Author(name="Bob"), Author(name="Linda")])
+
+   class BookForm(Form):
+       author = KeyPropertyField(reference_class=Author, backend=backend)
+
+The default queries of the fields can be scoped with an ancestor key, filters
+and orders, given in the form the backend's datastore library takes them.
+"""
+import collections
+import functools
+import itertools
+import threading
+import time
+
+from .instrument import record_rpc
+from .utils import get_kind
+from .utils import is_ndb_model
+
+
+def _entity_key(entity):
+    """
+    Returns the key of an ``ndb`` or ``db`` entity, or ``None`` if it doesn't
+    have one yet.
+    """
+    key = entity.key
+    if callable(key):
+        # db.Model.key() raises for entities without a complete key.
+        return key() if entity.has_key() else None
+    return key
+
+
+class NDBBackend:
+    """
+    Runs the datastore calls of the fields with ``ndb``.
+    """
+
+    def query(self, model, ancestor=None, filters=(), order=()):
+        """
+        Returns a query for the entities of ``model``.
+
+        :param ancestor:
+            An optional ancestor key.
+        :param filters:
+            A list of filter nodes, e.g. ``[Author.city == "Boston"]``.
+        :param order:
+            A list of orders, e.g. ``[-Author.age, Author.name]``.
+        """
+        query = model.query(*filters, ancestor=ancestor)
+        if order:
+            query = query.order(*order)
+        return query
+
+    def fetch(self, query, **options):
+        """Runs ``query``, returning a list of entities."""
+        return query.fetch(**options)
+
+    def fetch_async(self, query, **options):
+        """Starts running ``query``, returning a future for the entities."""
+        return query.fetch_async(**options)
+
+    def get_multi(self, keys):
+        """Returns the entities for a list of keys."""
+        futures = [key.get_async() for key in keys]
+        return [future.get_result() for future in futures]
+
+
+class DBBackend:
+    """
+    Runs the datastore calls of the fields with ``db``.
+    """
+
+    def query(self, model, ancestor=None, filters=(), order=()):
+        """
+        Returns a query for the entities of ``model``.
+
+        :param ancestor:
+            An optional ancestor key or entity.
+        :param filters:
+            A list of ``(property_operator, value)`` pairs, e.g.
+            ``[("city =", "Boston")]``.
+        :param order:
+            A list of property names, prefixed with ``-`` for descending
+            order.
+        """
+        query = model.all()
+        if ancestor is not None:
+            query.ancestor(ancestor)
+        for property_operator, value in filters:
+            query.filter(property_operator, value)
+        for name in order:
+            query.order(name)
+        return query
+
+    def fetch(self, query, **options):
+        """Runs ``query``, returning a list of entities."""
+        return list(query.run(**options))
+
+    def get_multi(self, keys):
+        """Returns the entities for a list of keys."""
+        from google.appengine.ext import db
+
+        return db.get(keys)
+
+
+# The kinds the RPCs of MemoryBackend are counted as by the instrumentation.
+_rpc_kinds = {"fetch": "query", "get": "get", "put": "put"}
+
+
+class MemoryFuture:
+    """
+    The result of :py:meth:`MemoryBackend.fetch_async`, which becomes ready
+    once the simulated latency has passed.
+    """
+
+    def __init__(self, result, ready_at):
+        self._result = result
+        self._ready_at = ready_at
+
+    def done(self):
+        return time.perf_counter() >= self._ready_at
+
+    def get_result(self):
+        remaining = self._ready_at - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        return self._result
+
+
+class MemoryQuery:
+    """
+    A query over the entities of a kind stored in a :py:class:`MemoryBackend`.
+
+    It can be used like an ``ndb.Query``: iterating over it or calling
+    :py:meth:`fetch` runs it through the backend. Queries of ``ndb`` models
+    can be scoped by an ``ndb.Query``, whose ancestor, filters and orders
+    are applied to the stored entities.
+    """
+
+    def __init__(self, backend, kind, scope=None):
+        self.backend = backend
+        self.kind = kind
+        self.scope = scope
+
+    def fetch(self, limit=None, **options):
+        return self.backend.fetch(self, limit=limit, **options)
+
+    def fetch_async(self, limit=None, **options):
+        return self.backend.fetch_async(self, limit=limit, **options)
+
+    def __iter__(self):
+        return iter(self.fetch())
+
+    def __repr__(self):
+        if self.scope is None:
+            return "MemoryQuery(kind=%r)" % self.kind
+        return "MemoryQuery(kind=%r, scope=%r, orders=%r)" % (
+            self.kind,
+            self.scope,
+            self.scope.orders,
+        )
+
+    def run(self, limit=None, offset=0):
+        """
+        Returns the matching entities, without going through the backend's
+        simulated RPC.
+        """
+        entities = list(self.backend.entities(self.kind))
+        if self.scope is not None:
+            entities = _scope_entities(self.scope, entities)
+        stop = None if limit is None else offset + limit
+        return entities[offset:stop]
+
+
+def _is_ancestor(ancestor, key):
+    """Returns true if ``key`` is ``ancestor`` or one of its descendants."""
+    while key is not None:
+        if key == ancestor:
+            return True
+        key = key.parent()
+    return False
+
+
+def _scope_entities(query, entities):
+    """
+    Applies the ancestor, filters and orders of an ``ndb.Query`` to a list of
+    entities, using the datastore's own predicates on their protobufs.
+    """
+    from google.appengine.ext import ndb
+
+    if query.ancestor is not None:
+        entities = [e for e in entities if _is_ancestor(query.ancestor, e.key)]
+
+    adapter = ndb.ModelAdapter()
+    pbs = {id(e): adapter.entity_to_pb(e) for e in entities}
+
+    if query.filters is not None:
+        if isinstance(query.filters, ndb.query.DisjunctionNode):
+            predicates = [node._to_filter() for node in query.filters]
+        else:
+            predicates = [query.filters._to_filter()]
+        entities = [e for e in entities if any(p(pbs[id(e)]) for p in predicates)]
+
+    if query.orders is not None:
+        compare = query.orders.cmp
+        entities.sort(
+            key=functools.cmp_to_key(lambda a, b: compare(pbs[id(a)], pbs[id(b)]))
+        )
+    return entities
+
+
+class MemoryBackend:
+    """
+    Keeps entities in memory, in the order they were put.
+
+    Every call to :py:meth:`fetch`, :py:meth:`fetch_async`, :py:meth:`get_multi`
+    and :py:meth:`put_multi` counts as one RPC: it takes ``latency`` seconds
+    and is counted in :py:attr:`calls`.
+
+    :param latency:
+        Simulated duration of an RPC, in seconds.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        #: Number of simulated RPCs, by method name.
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+        self._kinds = collections.defaultdict(dict)
+        self._ids = itertools.count(1)
+
+    def _rpc(self, name):
+        with self._lock:
+            self.calls[name] += 1
+        record_rpc(_rpc_kinds[name])
+        if self.latency:
+            time.sleep(self.latency)
+
+    def entities(self, kind):
+        """Returns the stored entities of ``kind``."""
+        return self._kinds[kind].values()
+
+    def put_multi(self, entities):
+        """
+        Stores ``entities``, returning their keys. ``ndb`` entities without a
+        key are given one with a numeric id.
+        """
+        self._rpc("put")
+        keys = []
+        for entity in entities:
+            key = _entity_key(entity)
+            if key is None:
+                from google.appengine.ext import ndb
+
+                key = entity.key = ndb.Key(get_kind(entity), next(self._ids))
+            with self._lock:
+                self._kinds[key.kind()][key] = entity
+            keys.append(key)
+        return keys
+
+    def put(self, entity):
+        """Stores ``entity``, returning its key."""
+        return self.put_multi([entity])[0]
+
+    def query(self, model, ancestor=None, filters=(), order=()):
+        """
+        Returns a query for the entities of ``model``, scoped like with
+        :py:meth:`NDBBackend.query`. Only queries of ``ndb`` models can be
+        scoped.
+        """
+        scope = None
+        if ancestor is not None or filters or order:
+            if not is_ndb_model(model):
+                raise TypeError(
+                    "MemoryBackend can't scope queries of db models (%s)"
+                    % get_kind(model)
+                )
+            scope = NDBBackend().query(model, ancestor, filters, order)
+        return MemoryQuery(self, get_kind(model), scope)
+
+    def fetch(self, query, limit=None, offset=0, **options):
+        """Runs ``query``, returning a list of entities."""
+        self._rpc("fetch")
+        return query.run(limit, offset)
+
+    def fetch_async(self, query, limit=None, offset=0, **options):
+        """Starts running ``query``, returning a future for the entities."""
+        with self._lock:
+            self.calls["fetch_async"] += 1
+        record_rpc("query")
+        ready_at = time.perf_counter() + self.latency
+        return MemoryFuture(query.run(limit, offset), ready_at)
+
+    def get_multi(self, keys):
+        """Returns the entities for a list of keys, ``None`` for missing ones."""
+        self._rpc("get")
+        return [self._kinds[key.kind()].get(key) for key in keys]
@@ -0,0 +1,589 @@
+"""
+Choice loading strategies for the reference fields, layered over a backend.
+
+``SingleFlightBackend`` wraps the backend of ``KeyPropertyField`` and
+``ReferencePropertyField``. When several threads of a ``threadsafe`` instance
+run the same choice query at once, only the first one goes to the datastore,
+and the others wait for its result:
+
+.. code-block:: python
+
+   KeyPropertyField.backend = SingleFlightBackend(NDBBackend())
+   ReferencePropertyField.backend = SingleFlightBackend(DBBackend())
+
+``StaleWhileRevalidateBackend`` bounds the time spent loading choices when the
+datastore is slow. Once a query was fetched, later fetches wait at most
+``deadline`` seconds for a fresh result, and serve the last one otherwise,
+while the refresh completes in the background:
+
+.. code-block:: python
+
+   backend = StaleWhileRevalidateBackend(NDBBackend(), deadline=0.2)
+   KeyPropertyField.backend = backend
+   PrefetchedKeyPropertyField.backend = backend
+
+``IncrementalChoicesBackend`` keeps the choices of ``ndb`` models in memory,
+and updates them when their entities are put or deleted, instead of fetching
+them again:
+
+.. code-block:: python
+
+   backend = IncrementalChoicesBackend(NDBBackend(), max_age=600)
+   backend.register_form(BookForm)
+   KeyPropertyField.backend = backend
+"""
+
+import collections
+import functools
+import sys
+import threading
+import time
+
+from .backends import _scope_entities
+from .fingerprint import query_fingerprint
+
+
+class _Call:
+    """A call in flight, waited on by the callers sharing its result."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call at a time for each key. Callers arriving while a
+    call for their key is in flight wait for it and share its result, or its
+    exception. Results aren't kept once the call is done.
+
+    :param timeout:
+        Maximum number of seconds to wait for a call in flight, after which
+        ``TimeoutError`` is raised. ``None`` waits indefinitely.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Returns ``func(*args, **kwargs)``, or the result of the call in flight
+        for ``key``.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            return self._wait(call)
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def _wait(self, call):
+        if not call.event.wait(self.timeout):
+            raise TimeoutError("Timed out waiting for a call in flight")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def in_flight(self):
+        """Returns the number of calls in flight."""
+        return len(self._calls)
+
+
+#: The group shared by the backends created without one.
+default_group = SingleFlight()
+
+
+class SingleFlightBackend:
+    """
+    Wraps a backend so that concurrent fetches of the same query share a
+    single datastore call.
+
+    Queries are matched by :py:func:`query_fingerprint` and by the wrapped
+    backend. Callers sharing a fetch get the same list of entities, which
+    must not be modified. ``fetch_async`` isn't shared, since ``ndb`` futures
+    belong to the event loop of the thread that started them.
+
+    :param backend:
+        The backend running the datastore calls.
+    :param group:
+        The :py:class:`SingleFlight` tracking the fetches in flight. Defaults
+        to a group shared by the whole process.
+    """
+
+    def __init__(self, backend, group=None):
+        self.backend = backend
+        self.group = default_group if group is None else group
+
+    def query(self, model, **scope):
+        return self.backend.query(model, **scope)
+
+    def fetch(self, query, **options):
+        key = (self.backend, query_fingerprint(query, **options))
+        return self.group.do(key, self.backend.fetch, query, **options)
+
+    def fetch_async(self, query, **options):
+        return self.backend.fetch_async(query, **options)
+
+    def get_multi(self, keys):
+        return self.backend.get_multi(keys)
+
+
+class _ChoicesFuture:
+    """
+    The result of :py:meth:`StaleWhileRevalidateBackend.fetch_async`.
+    """
+
+    def __init__(self, backend, call, entry, deadline_at):
+        self._backend = backend
+        self._call = call
+        self._entry = entry
+        self._deadline_at = deadline_at
+        self._result = None if call is not None else entry[0]
+
+    def done(self):
+        return self._call is None or self._call.event.is_set()
+
+    def get_result(self):
+        if self._result is None:
+            self._result = self._wait()
+        return self._result
+
+    def _wait(self):
+        call = self._call
+        timeout = None
+        if self._entry is not None and self._deadline_at is not None:
+            timeout = max(0, self._deadline_at - time.monotonic())
+
+        if call.event.wait(timeout):
+            if call.error is None:
+                self._backend._count("refreshed" if self._entry else "miss")
+                return call.result
+            if self._entry is None:
+                raise call.error
+        self._backend._count("stale")
+        return self._entry[0]
+
+
+class StaleWhileRevalidateBackend:
+    """
+    Wraps a backend to serve the last good result of a query when fetching it
+    takes longer than a deadline.
+
+    Results are kept for each query fingerprint, for at most ``max_queries``
+    queries, the least recently fetched being dropped first. A query fetched
+    less than ``max_age`` seconds ago is served from memory. Otherwise it is
+    refreshed in the background, one refresh at a time per query, and callers
+    wait up to ``deadline`` seconds for it. If it is late or fails, they get
+    the previous result. A query fetched for the first time is always waited
+    for.
+
+    Refreshes run on a pool of ``max_refreshes`` worker threads, outside of
+    the request that started them. The wrapped backend must not depend on
+    the request: ``ndb`` runs the fetch in a new context of the worker
+    thread, without the request's context cache, and the runtime must allow
+    API calls from threads the request didn't start.
+
+    The outcome of each fetch is counted in :py:attr:`stats`: ``"hit"``
+    (served from memory), ``"miss"`` (first fetch), ``"refreshed"``
+    (refreshed within the deadline), ``"stale"`` (the previous result was
+    served) and ``"error"`` (a refresh failed).
+
+    :param backend:
+        The backend running the datastore calls.
+    :param deadline:
+        Number of seconds to wait for a refresh before serving the previous
+        result. ``None`` always waits.
+    :param max_age:
+        Number of seconds a result is served without being refreshed.
+    :param max_queries:
+        Number of queries whose last result is kept.
+    :param max_refreshes:
+        Number of refreshes run at the same time. Others wait for a worker
+        thread.
+    """
+
+    def __init__(
+        self, backend, deadline=None, max_age=0, max_queries=1000, max_refreshes=4
+    ):
+        self.backend = backend
+        self.deadline = deadline
+        self.max_age = max_age
+        self.max_queries = max_queries
+        self.max_refreshes = max_refreshes
+        #: Number of fetches, by outcome.
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._results = collections.OrderedDict()
+        self._refreshes = {}
+        self._executor = None
+
+    def _count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def query(self, model, **scope):
+        return self.backend.query(model, **scope)
+
+    def fetch(self, query, **options):
+        return self.fetch_async(query, **options).get_result()
+
+    def fetch_async(self, query, **options):
+        key = query_fingerprint(query, **options)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                self._results.move_to_end(key)
+        if entry is not None and now - entry[1] < self.max_age:
+            self._count("hit")
+            return _ChoicesFuture(self, None, entry, None)
+
+        deadline_at = None if self.deadline is None else now + self.deadline
+        call = self._refresh(key, query, options)
+        return _ChoicesFuture(self, call, entry, deadline_at)
+
+    def get_multi(self, keys):
+        return self.backend.get_multi(keys)
+
+    def _refresh(self, key, query, options):
+        """Returns the refresh in progress for a query, starting one if needed."""
+        with self._lock:
+            call = self._refreshes.get(key)
+            if call is None:
+                call = self._refreshes[key] = _Call()
+                if self._executor is None:
+                    import concurrent.futures
+
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        self.max_refreshes, thread_name_prefix="choices-refresh"
+                    )
+                self._executor.submit(self._run, key, call, query, options)
+        return call
+
+    def _run(self, key, call, query, options):
+        # The worker threads outlive the refreshes: give each one a new ndb
+        # context, so the cache of the last one doesn't serve its entities.
+        _reset_ndb_context()
+        try:
+            call.result = self.backend.fetch(query, **options)
+        except Exception as exc:
+            call.error = exc
+            self._count("error")
+        else:
+            with self._lock:
+                self._results[key] = (call.result, time.monotonic())
+                self._results.move_to_end(key)
+                while len(self._results) > self.max_queries:
+                    self._results.popitem(last=False)
+        finally:
+            _reset_ndb_context()
+            with self._lock:
+                del self._refreshes[key]
+            call.event.set()
+
+
+def _reset_ndb_context():
+    """
+    Drops the ``ndb`` context of the current thread, if ``ndb`` is in use, so
+    the next call gets a new one.
+    """
+    tasklets = sys.modules.get("google.appengine.ext.ndb.tasklets")
+    if tasklets is not None:
+        tasklets.set_context(None)
+
+
+# Fetch options for which the cached results can't be updated from a write.
+_partial_options = frozenset(
+    ["limit", "offset", "keys_only", "projection", "start_cursor", "end_cursor"]
+)
+
+# The incremental backends notified of the writes of each model class.
+_write_listeners = {}
+
+
+def _add_write_hooks(model):
+    """
+    Adds post put and post delete hooks to an ``ndb`` model class, which
+    notify the backends listening to it once the write is committed. The
+    hooks the model class already has are still called. Returns the list of
+    listening backends.
+    """
+    listeners = _write_listeners[model] = []
+    put_hook = model._post_put_hook
+    # The classmethod itself, to call it on the class the key was deleted
+    # with, which can be a subclass.
+    delete_hook = model.__dict__.get("_post_delete_hook")
+
+    def _post_put_hook(self, future):
+        put_hook(self, future)
+        if future.get_exception() is None:
+            _on_commit(functools.partial(_notify, listeners, "entity_put", self))
+
+    def _post_delete_hook(cls, key, future):
+        if delete_hook is None:
+            super(model, cls)._post_delete_hook(key, future)
+        else:
+            delete_hook.__get__(None, cls)(key, future)
+        if future.get_exception() is None:
+            _on_commit(functools.partial(_notify, listeners, "entity_deleted", key))
+
+    model._post_put_hook = _post_put_hook
+    model._post_delete_hook = classmethod(_post_delete_hook)
+    return listeners
+
+
+def _notify(listeners, method, *args):
+    for backend in list(listeners):
+        getattr(backend, method)(*args)
+
+
+def _on_commit(callback):
+    """Calls ``callback`` now, or when the current transaction commits."""
+    from google.appengine.ext import ndb
+
+    ndb.get_context().call_on_commit(callback)
+
+
+def _apply_write(query, entities, key, entity):
+    """
+    Returns a copy of the results of an ``ndb`` query with the entity of
+    ``key`` replaced by ``entity``. It is removed if ``entity`` is ``None``
+    or doesn't match the query, and a copy of it is inserted at its position
+    in the query order otherwise, so later changes to ``entity`` aren't
+    shared.
+    """
+    from google.appengine.datastore import datastore_query
+    from google.appengine.ext import ndb
+
+    entities = [x for x in entities if x.key != key]
+    if entity is None or not _scope_entities(query, [entity]):
+        return entities
+
+    # The datastore breaks ties, and orders unordered queries, by key.
+    order = datastore_query.PropertyOrder("__key__")
+    if query.orders is not None:
+        order = datastore_query.CompositeOrder([query.orders, order])
+
+    adapter = ndb.ModelAdapter()
+    pb = adapter.entity_to_pb(entity)
+    low, high = 0, len(entities)
+    while low < high:
+        middle = (low + high) // 2
+        if order.cmp(adapter.entity_to_pb(entities[middle]), pb) < 0:
+            low = middle + 1
+        else:
+            high = middle
+    entities.insert(low, adapter.pb_to_entity(pb))
+    return entities
+
+
+class _FetchedFuture:
+    """
+    The result of :py:meth:`IncrementalChoicesBackend.fetch_async`, either
+    cached or stored once fetched.
+    """
+
+    def __init__(self, result=None, future=None, store=None):
+        self._result = result
+        self._future = future
+        self._store = store
+
+    def done(self):
+        return self._future is None or self._future.done()
+
+    def get_result(self):
+        if self._future is not None:
+            self._result = self._store(self._future.get_result())
+            self._future = None
+        return self._result
+
+
+class _CachedResult:
+    """The results of a query, kept by :py:class:`IncrementalChoicesBackend`."""
+
+    __slots__ = ("query", "options", "entities", "fetched_at")
+
+    def __init__(self, query, options, entities):
+        self.query = query
+        self.options = options
+        self.entities = entities
+        self.fetched_at = time.monotonic()
+
+
+class IncrementalChoicesBackend:
+    """
+    Wraps an ``ndb`` backend to keep the results of the choice queries in
+    memory, updated from the puts and deletes of their entities rather than
+    fetched again.
+
+    Only the queries of the models given to :py:meth:`register` are kept,
+    which adds ``_post_put_hook`` and ``_post_delete_hook`` hooks to them.
+    When an entity is put, it is removed from the results of the queries of
+    its kind, and inserted back in those it matches, at its position in the
+    query order. A deleted entity is removed. Results that can't be updated
+    this way, fetched with a ``limit``, ``offset``, ``keys_only`` or
+    ``projection``, are dropped instead. Writes made in a transaction are
+    applied once it commits.
+
+    The hooks only see the writes of the current instance: ``max_age``
+    bounds how long the writes of other instances go unnoticed.
+
+    Callers share the results, which must not be modified. Writes replace
+    them with new lists, so lists handed out never change. The outcome of
+    each fetch and write is counted in :py:attr:`stats`: ``"hit"`` (served
+    from memory), ``"miss"`` (fetched), ``"updated"`` (results updated by a
+    write) and ``"dropped"`` (results dropped by a write).
+
+    :param backend:
+        The backend running the datastore calls.
+    :param max_age:
+        Number of seconds the results of a query are kept. ``None`` keeps
+        them until they are dropped.
+    """
+
+    def __init__(self, backend, max_age=None):
+        self.backend = backend
+        self.max_age = max_age
+        #: Number of fetches and writes, by outcome.
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._kinds = set()
+        self._results = {}
+        # The fingerprints of the cached results, by kind.
+        self._fingerprints = collections.defaultdict(set)
+        # Number of writes seen by kind, to detect those made during a fetch.
+        self._versions = collections.Counter()
+
+    def register(self, *models):
+        """
+        Keeps the results of the queries of ``models``, and adds the hooks
+        updating them to the model classes.
+        """
+        for model in models:
+            listeners = _write_listeners.get(model)
+            if listeners is None:
+                listeners = _add_write_hooks(model)
+            if self not in listeners:
+                listeners.append(self)
+            self._kinds.add(model._get_kind())
+
+    def unregister(self, *models):
+        """Stops keeping the results of the queries of ``models``."""
+        for model in models:
+            listeners = _write_listeners.get(model, [])
+            if self in listeners:
+                listeners.remove(self)
+            self.invalidate(model._get_kind())
+            self._kinds.discard(model._get_kind())
+
+    def register_form(self, form_class):
+        """Registers the reference classes of the key fields of a form class."""
+        from .utils import key_fields
+
+        for _, field in key_fields(form_class):
+            model = field.kwargs.get("reference_class")
+            if isinstance(model, str):
+                from google.appengine.ext import ndb
+
+                model = ndb.Model._lookup_model(model)
+            if model is not None:
+                self.register(model)
+
+    def invalidate(self, kind):
+        """Drops the results of the queries of ``kind``."""
+        with self._lock:
+            self._versions[kind] += 1
+            for fingerprint in self._fingerprints.pop(kind, ()):
+                del self._results[fingerprint]
+
+    def query(self, model, **scope):
+        return self.backend.query(model, **scope)
+
+    def fetch(self, query, **options):
+        entities, store = self._lookup(query, options)
+        if store is None:
+            return entities
+        return store(self.backend.fetch(query, **options))
+
+    def fetch_async(self, query, **options):
+        entities, store = self._lookup(query, options)
+        if store is None:
+            return _FetchedFuture(entities)
+        future = self.backend.fetch_async(query, **options)
+        return _FetchedFuture(future=future, store=store)
+
+    def get_multi(self, keys):
+        return self.backend.get_multi(keys)
+
+    def _lookup(self, query, options):
+        """
+        Returns the cached results of a query and ``None``, or ``None`` and a
+        function storing the fetched results.
+        """
+        kind = getattr(query, "kind", None)
+        if kind not in self._kinds:
+            return None, lambda entities: entities
+
+        fingerprint = query_fingerprint(query, **options)
+        with self._lock:
+            cached = self._results.get(fingerprint)
+            if cached is not None and (
+                self.max_age is None
+                or time.monotonic() - cached.fetched_at < self.max_age
+            ):
+                self.stats["hit"] += 1
+                return cached.entities, None
+            self.stats["miss"] += 1
+            version = self._versions[kind]
+
+        def store(entities):
+            entities = list(entities)
+            with self._lock:
+                # Results fetched while the kind was written may be stale.
+                if self._versions[kind] == version:
+                    self._results[fingerprint] = _CachedResult(query, options, entities)
+                    self._fingerprints[kind].add(fingerprint)
+            return entities
+
+        return None, store
+
+    def entity_put(self, entity):
+        """Applies the put of an entity to the cached results of its kind."""
+        self._apply(entity.key, entity)
+
+    def entity_deleted(self, key):
+        """Applies the deletion of a key to the cached results of its kind."""
+        self._apply(key, None)
+
+    def _apply(self, key, entity):
+        kind = key.kind()
+        with self._lock:
+            self._versions[kind] += 1
+            fingerprints = self._fingerprints[kind]
+            for fingerprint in list(fingerprints):
+                cached = self._results[fingerprint]
+                query = cached.query
+                if _partial_options.intersection(cached.options) or getattr(
+                    query, "projection", None
+                ):
+                    del self._results[fingerprint]
+                    fingerprints.discard(fingerprint)
+                    self.stats["dropped"] += 1
+                else:
+                    cached.entities = _apply_write(query, cached.entities, key, entity)
+                    self.stats["updated"] += 1
@@ -0,0 +1,381 @@
+"""
+Ahead-of-time generation of form classes.
+
+``model_form()`` converts the model properties every time it is called, which
+on App Engine means on every cold start. This module writes the form classes
+that ``model_form()`` would build to a plain Python module instead, which can
+be committed and imported at startup.
+
+The forms are described by a list of ``(model, options)`` specs, where the
+options are the keyword arguments accepted by ``model_form()`` (``only``,
+``exclude``, ``field_args``, ``converter`` and ``base_class``) plus an
+optional ``name`` for the generated class:
+
+.. code-block:: python
+
+   # myapp/form_specs.py
+   FORM_SPECS = [
+       (Contact, {}),
+       (Contact, {"name": "ContactNameForm", "only": ("name",)}),
+   ]
+
+The module is written, or checked for drift against the current models, from
+the command line:
+
+.. code-block:: console
+
+   $ python -m wtforms_appengine.codegen myapp.form_specs:FORM_SPECS \\
+         myapp/generated_forms.py
+   $ python -m wtforms_appengine.codegen --check myapp.form_specs:FORM_SPECS \\
+         myapp/generated_forms.py
+
+Every value in the generated fields must be expressible as source code:
+literals, importable classes and functions, and objects that can be rebuilt
+from their constructor arguments, such as the ``wtforms`` validators.
+"""
+import argparse
+import datetime
+import decimal
+import difflib
+import importlib
+import inspect
+import re
+import sys
+
+from wtforms import Form
+
+from .utils import get_kind
+from .utils import model_fields
+
+HEADER = '''"""
+Form classes generated by ``wtforms_appengine.codegen``. Do not edit.
+"""
+'''
+
+_literal_types = (str, bytes, int, float, bool, type(None))
+_pattern_type = type(re.compile(""))
+
+
+def _constructor_params(cls):
+    """
+    Returns the named parameters of the first ``__init__`` in the MRO of
+    ``cls`` that doesn't just pass ``*args, **kwargs`` along.
+    """
+    for klass in cls.__mro__:
+        init = klass.__dict__.get("__init__")
+        if init is None or not inspect.isfunction(init):
+            continue
+        params = list(inspect.signature(init).parameters.values())[1:]
+        named = [p for p in params if p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)]
+        if named or not params:
+            return named
+    return []
+
+
+def _resolve(module, qualname):
+    """
+    Returns the object named ``qualname`` in ``module``, or ``None`` if it
+    can't be imported.
+    """
+    if not module or not qualname or "<" in qualname:
+        return None
+    try:
+        obj = importlib.import_module(module)
+    except ImportError:
+        return None
+    for name in qualname.split("."):
+        obj = getattr(obj, name, None)
+    return obj
+
+
+def _same_state(obj, cls, kwargs):
+    """
+    Returns true if ``cls(**kwargs)`` has the same attributes as ``obj``.
+    Functions, such as the lambdas some validators keep, are compared by
+    their code.
+    """
+    try:
+        rebuilt = cls(**kwargs)
+        state, other = vars(obj), vars(rebuilt)
+    except TypeError:
+        return False
+    if state.keys() != other.keys():
+        return False
+    for name, value in state.items():
+        if inspect.isfunction(value) and inspect.isfunction(other[name]):
+            if value.__code__ is not other[name].__code__:
+                return False
+        elif value != other[name]:
+            return False
+    return True
+
+
+class ModuleWriter:
+    """
+    Renders form classes, and every value they reference, as the source code
+    of a Python module.
+    """
+
+    def __init__(self):
+        # (module, name) -> local name, in order of first use
+        self.imports = {}
+        # runtime form class -> name of its generated class
+        self.forms = {}
+        self.names = set()
+        self.blocks = []
+
+    def import_name(self, obj):
+        """
+        Returns the local name ``obj`` is available as in the generated
+        module, adding the import for it.
+        """
+        module = getattr(obj, "__module__", None)
+        qualname = getattr(obj, "__qualname__", "")
+        if _resolve(module, qualname) is not obj:
+            # A lambda, a local or a bound method, which can't be imported.
+            raise ValueError("Can't generate an import for %r" % (obj,))
+
+        top, _, rest = qualname.partition(".")
+        local = self.imports.get((module, top))
+        if local is None:
+            taken = set(self.imports.values())
+            local = top
+            counter = 1
+            while local in taken:
+                counter += 1
+                local = "%s_%d" % (top, counter)
+            self.imports[(module, top)] = local
+
+        return local + ("." + rest if rest else "")
+
+    def literal(self, value):
+        """
+        Returns the source code for ``value``.
+        """
+        if isinstance(value, _literal_types):
+            return repr(value)
+        if isinstance(value, list):
+            return "[%s]" % ", ".join(self.literal(v) for v in value)
+        if isinstance(value, tuple):
+            items = [self.literal(v) for v in value]
+            return "(%s)" % (items[0] + "," if len(items) == 1 else ", ".join(items))
+        if isinstance(value, (set, frozenset)):
+            items = sorted(self.literal(v) for v in value)
+            return "%s([%s])" % (type(value).__name__, ", ".join(items))
+        if isinstance(value, dict):
+            items = (
+                "%s: %s" % (self.literal(k), self.literal(v)) for k, v in value.items()
+            )
+            return "{%s}" % ", ".join(items)
+        if isinstance(value, (datetime.date, datetime.time, decimal.Decimal)):
+            local = self.import_name(type(value))
+            source = repr(value)
+            prefix = "%s.%s(" % (type(value).__module__, type(value).__qualname__)
+            if source.startswith(prefix):
+                start = len(prefix) - 1
+                source = local + source[start:]
+            return source
+        if isinstance(value, _pattern_type):
+            self.imports.setdefault(("", "re"), "re")
+            return "re.compile(%r, %r)" % (value.pattern, value.flags)
+        if inspect.isclass(value) and issubclass(value, Form):
+            return self.form_name(value)
+        if inspect.isclass(value) or inspect.isroutine(value):
+            return self.import_name(value)
+        if hasattr(value, "field_class") and hasattr(value, "kwargs"):
+            return self.unbound_field(value)
+        return self.instance(value)
+
+    def instance(self, obj):
+        """
+        Returns the source code rebuilding ``obj`` from the attributes
+        matching its constructor arguments.
+        """
+        kwargs = {}
+        unread = []
+        for param in _constructor_params(type(obj)):
+            if not hasattr(obj, param.name):
+                if param.default is param.empty:
+                    raise ValueError("Can't generate code for %r" % (obj,))
+                unread.append(param.name)
+                continue
+            value = getattr(obj, param.name)
+            if param.default is not param.empty and value == param.default:
+                continue
+            kwargs[param.name] = value
+
+        # Arguments that aren't kept as attributes are left to their default,
+        # which must rebuild the same object.
+        if unread and not _same_state(obj, type(obj), kwargs):
+            raise ValueError(
+                "Can't generate code for %r, %s can't be read back"
+                % (obj, ", ".join(unread))
+            )
+
+        args = ["%s=%s" % (key, self.literal(value)) for key, value in kwargs.items()]
+        return "%s(%s)" % (self.import_name(type(obj)), ", ".join(args))
+
+    def unbound_field(self, field):
+        """
+        Returns the source code for a field declaration.
+        """
+        args = [self.literal(arg) for arg in field.args]
+        args.extend(
+            "%s=%s" % (key, self.literal(value))
+            for key, value in sorted(field.kwargs.items())
+        )
+        return "%s(%s)" % (self.import_name(field.field_class), ", ".join(args))
+
+    def form_name(self, form_class):
+        """
+        Returns the name of a form class. Importable forms are imported, and
+        forms generated at runtime (such as subforms) are written to the
+        module.
+        """
+        if form_class in self.forms:
+            return self.forms[form_class]
+        if "<locals>" not in form_class.__qualname__:
+            try:
+                module = importlib.import_module(form_class.__module__)
+            except ImportError:
+                module = None
+            if getattr(module, form_class.__name__, None) is form_class:
+                return self.import_name(form_class)
+
+        fields = [
+            (name, getattr(form_class, name))
+            for name in dir(form_class)
+            if hasattr(getattr(form_class, name), "field_class")
+        ]
+        fields.sort(key=lambda x: x[1].creation_counter)
+        name = self.add_form(form_class.__name__, form_class.__bases__[0], fields)
+        self.forms[form_class] = name
+        return name
+
+    def add_form(self, name, base_class, fields):
+        """
+        Writes a form class with the given ``(name, unbound field)`` pairs,
+        returning its name.
+        """
+        if name in self.names:
+            raise ValueError("Duplicate form class name %r" % name)
+        self.names.add(name)
+
+        lines = []
+        for field_name, field in fields:
+            lines.append("    %s = %s" % (field_name, self.literal(field)))
+        if not lines:
+            lines.append("    pass")
+
+        base = self.literal(base_class)
+        self.blocks.append("class %s(%s):\n%s" % (name, base, "\n".join(lines)))
+        return name
+
+    def add_spec(self, model, options):
+        """
+        Writes the form class ``model_form()`` would build for ``model`` with
+        ``options``.
+        """
+        options = dict(options)
+        name = options.pop("name", None) or get_kind(model) + "Form"
+        base_class = options.pop("base_class", Form)
+        extra_fields = options.pop("extra_fields", None)
+
+        field_dict = model_fields(model, **options)
+        if extra_fields:
+            field_dict.update(extra_fields)
+
+        return self.add_form(name, base_class, list(field_dict.items()))
+
+    def source(self):
+        """
+        Returns the source code of the module.
+        """
+        plain = sorted(m for (m, name) in self.imports if not m)
+        from_imports = sorted(
+            "from %s import %s" % (m, name)
+            + (" as %s" % local if local != name else "")
+            for (m, name), local in self.imports.items()
+            if m
+        )
+        imports = ["import %s" % m for m in plain] + from_imports
+        blocks = "\n\n\n".join(self.blocks)
+        return "%s%s\n\n\n%s\n" % (HEADER, "\n".join(imports), blocks)
+
+
+def generate_module(specs):
+    """
+    Returns the source code of a module defining a form class for each
+    ``(model, options)`` spec, as ``model_form(model, **options)`` would
+    generate it.
+
+    :param specs:
+        An iterable of ``(model, options)`` tuples. ``options`` holds the
+        keyword arguments for ``model_form()``, plus an optional ``name`` for
+        the class, which defaults to the model kind followed by ``Form``.
+    """
+    writer = ModuleWriter()
+    for model, options in specs:
+        writer.add_spec(model, options or {})
+    return writer.source()
+
+
+def check_module(path, specs):
+    """
+    Compares the module at ``path`` with the code generated for ``specs``.
+
+    Returns a unified diff of the differences, which is empty if the module
+    is up to date with the models.
+    """
+    try:
+        with open(path, encoding="utf8") as fp:
+            current = fp.read()
+    except FileNotFoundError:
+        current = ""
+
+    expected = generate_module(specs)
+    diff = difflib.unified_diff(
+        current.splitlines(True),
+        expected.splitlines(True),
+        fromfile=path,
+        tofile=path + " (generated)",
+    )
+    return "".join(diff)
+
+
+def _load_specs(reference):
+    module_name, _, attr = reference.partition(":")
+    if not attr:
+        raise ValueError("Specs must be given as 'module:attribute'")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m wtforms_appengine.codegen",
+        description="Generate a module of form classes from model specs.",
+    )
+    parser.add_argument("specs", help="The specs list, as 'module:attribute'.")
+    parser.add_argument("output", help="Path of the generated module.")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Don't write the module, exit with an error if it is out of date.",
+    )
+    args = parser.parse_args(argv)
+
+    specs = _load_specs(args.specs)
+    if args.check:
+        diff = check_module(args.output, specs)
+        if diff:
+            sys.stdout.write(diff)
+            return 1
+        return 0
+
+    with open(args.output, "w", encoding="utf8") as fp:
+        fp.write(generate_module(specs))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -95,9 +95,12 @@ from wtforms import fields as f
 from wtforms import Form
 from wtforms import validators
 
+from .fields import BlobUploadField
+from .fields import BytesWriter
 from .fields import GeoPtPropertyField
 from .fields import ReferencePropertyField
 from .fields import StringListPropertyField
+from .instrument import reports_generation
 
 
 def get_StringField(kwargs):
@@ -203,8 +206,15 @@ def convert_UserProperty(model, prop, kwargs):
 
 
 def convert_BlobProperty(model, prop, kwargs):
-    """Returns a form field for a ``db.BlobProperty``."""
-    return f.FileField(**kwargs)
+    """
+    Returns a form field for a ``db.BlobProperty``. Uploads are read into
+    ``bytes``, unless another ``writer`` is given in the field args, and are
+    limited to the 1 MB an entity can hold unless another ``max_size`` is
+    given.
+    """
+    kwargs.setdefault("writer", BytesWriter)
+    kwargs.setdefault("max_size", 1024 * 1024)
+    return BlobUploadField(**kwargs)
 
 
 def convert_TextProperty(model, prop, kwargs):
@@ -294,7 +304,7 @@ class ModelConverter:
     +--------------------+-------------------+--------------+------------------+
     | UserProperty       | None              | users.User   | always skipped   |
     +--------------------+-------------------+--------------+------------------+
-    | BlobProperty       | FileField         | str          |                  |
+    | BlobProperty       | BlobUploadField   | bytes        |                  |
     +--------------------+-------------------+--------------+------------------+
     | TextProperty       | TextAreaField     | unicode      |                  |
     +--------------------+-------------------+--------------+------------------+
@@ -349,6 +359,14 @@ class ModelConverter:
         ["ListProperty", "StringListProperty", "BooleanProperty"]
     )
 
+    # Property class -> converter for the default converters, filled on first
+    # use for each converter class.
+    _dispatch_cache = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch_cache = {}
+
     def __init__(self, converters=None):
         """
         Constructs the converter, setting the converter callables.
@@ -359,6 +377,35 @@ class ModelConverter:
         """
         self.converters = converters or self.default_converters
 
+    def get_converter(self, prop_type):
+        """
+        Returns the converter callable for a property class, or ``None``.
+
+        The property class MRO is walked so subclasses of the known properties
+        are converted like their base class. Lookups in the default converters
+        are cached for each converter class.
+
+        :param prop_type:
+            The property class.
+        """
+        if self.converters is self.default_converters:
+            cache = self._dispatch_cache
+        else:
+            cache = None
+
+        if cache is not None and prop_type in cache:
+            return cache[prop_type]
+
+        converter = None
+        for klass in prop_type.__mro__:
+            converter = self.converters.get(klass.__name__)
+            if converter is not None:
+                break
+
+        if cache is not None:
+            cache[prop_type] = converter
+        return converter
+
     def convert(self, model, prop, field_args):
         """
         Returns a form field for a single model property.
@@ -388,11 +435,14 @@ class ModelConverter:
                 kwargs["choices"] = [(v, v) for v in prop.choices]
             return f.SelectField(**kwargs)
         else:
-            converter = self.converters.get(prop_type_name, None)
+            converter = self.get_converter(type(prop))
             if converter is not None:
                 return converter(model, prop, kwargs)
 
 
+default_converter = ModelConverter()
+
+
 def model_fields(model, only=None, exclude=None, field_args=None, converter=None):
     """
     Extracts and returns a dictionary of form fields for a given
@@ -411,9 +461,9 @@ def model_fields(model, only=None, exclude=None, field_args=None, converter=None
         used to construct each field object.
     :param converter:
         A converter to generate the fields based on the model properties. If
-        not set, ``ModelConverter`` is used.
+        not set, a shared ``ModelConverter`` instance is used.
     """
-    converter = converter or ModelConverter()
+    converter = converter or default_converter
     field_args = field_args or {}
 
     # Get the field names we want to include or exclude, starting with the
@@ -439,6 +489,7 @@ def model_fields(model, only=None, exclude=None, field_args=None, converter=None
     return field_dict
 
 
+@reports_generation
 def model_form(
     model, base_class=Form, only=None, exclude=None, field_args=None, converter=None
 ):
@@ -463,7 +514,7 @@ def model_form(
         used to construct each field object.
     :param converter:
         A converter to generate the fields based on the model properties. If
-        not set, ``ModelConverter`` is used.
+        not set, a shared ``ModelConverter`` instance is used.
     """
     # Extract the fields from the model.
     field_dict = model_fields(model, only, exclude, field_args, converter)
@@ -0,0 +1,283 @@
+"""
+Read-only display of entities, using the labels and formatting of the fields
+``model_form()`` generates, without building forms.
+
+Detail and list pages only need the converted labels and formatted values, so
+``DisplayRenderer`` reads the conversion metadata once and formats values
+straight from the entities. No ``Field`` objects are bound, no choice queries
+are run, and the labels of referenced entities are looked up with a single
+batch get for all the rows:
+
+.. code-block:: python
+
+   renderer = DisplayRenderer(Book, exclude=("notes",))
+
+   for name, label in renderer.labels:
+       ...
+   for row in renderer.rows(Book.query().fetch(20)):
+       for label, text in row:
+           ...
+       row["author"]  # The label of the referenced author.
+"""
+import json
+import operator
+
+from .backends import DBBackend
+from .backends import NDBBackend
+from .utils import is_ndb_model
+from .utils import model_fields
+
+
+class DisplayColumn:
+    """
+    A model property to be displayed.
+    """
+
+    __slots__ = ("name", "label", "field_class", "kwargs", "formatter", "get_label")
+
+    def __init__(self, name, unbound_field):
+        self.name = name
+        self.field_class = unbound_field.field_class
+        self.kwargs = unbound_field.kwargs
+        self.label = self.kwargs.get("label") or name
+        self.formatter = None
+
+        get_label = self.kwargs.get("get_label")
+        if isinstance(get_label, str):
+            get_label = operator.attrgetter(get_label)
+        self.get_label = get_label or str
+
+
+class DisplayRow:
+    """
+    The formatted values of an entity, in column order. Iterating over a row
+    yields ``(label, text)`` pairs, and the text of a column can be looked up
+    by name.
+    """
+
+    __slots__ = ("renderer", "entity", "values")
+
+    def __init__(self, renderer, entity, values):
+        self.renderer = renderer
+        self.entity = entity
+        self.values = values
+
+    def __iter__(self):
+        return zip((c.label for c in self.renderer.columns), self.values)
+
+    def __getitem__(self, name):
+        return self.values[self.renderer.column_index[name]]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class _Reference:
+    """
+    Placeholder for the labels of referenced entities, filled in after the
+    batch get.
+    """
+
+    __slots__ = ("keys", "column", "repeated")
+
+    def __init__(self, keys, column, repeated):
+        self.keys = keys
+        self.column = column
+        self.repeated = repeated
+
+
+class DisplayRenderer:
+    """
+    Formats entities of a model for display.
+
+    Values are formatted by the ``format_<FieldClass>`` method matching the
+    class of the field ``model_form()`` would generate for the property,
+    walking up the field class MRO. Fields without one are displayed with
+    ``str()``. Fields listed in ``hidden_fields``, such as the subforms of
+    structured properties, are left out.
+
+    :param model:
+        The ``ndb.Model`` or ``db.Model`` class of the entities.
+    :param only:
+        An optional iterable with the property names to display.
+    :param exclude:
+        An optional iterable with the property names to leave out.
+    :param field_args:
+        An optional dictionary of field names mapping to the keyword arguments
+        ``model_form()`` would pass to the field, e.g. to change a label.
+    :param converter:
+        The converter generating the field metadata.
+    :param backend:
+        The backend used to look up referenced entities. Defaults to the
+        backend of the model's datastore library.
+    """
+
+    blank = ""
+
+    #: Names of the field classes that aren't displayed.
+    hidden_fields = frozenset(["FormField", "FieldList", "BlobUploadField"])
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._formatter_methods = _formatter_methods(cls)
+
+    def __init__(
+        self,
+        model,
+        only=None,
+        exclude=None,
+        field_args=None,
+        converter=None,
+        backend=None,
+    ):
+        self.model = model
+        if backend is None:
+            backend = NDBBackend() if is_ndb_model(model) else DBBackend()
+        self.backend = backend
+
+        field_dict = model_fields(
+            model,
+            only=only,
+            exclude=exclude,
+            field_args=field_args,
+            converter=converter,
+        )
+
+        self.columns = []
+        for name, unbound_field in field_dict.items():
+            column = DisplayColumn(name, unbound_field)
+            column.formatter = self.get_formatter(column.field_class)
+            if column.formatter is not None:
+                self.columns.append(column)
+        self.column_index = {c.name: i for i, c in enumerate(self.columns)}
+
+    @property
+    def labels(self):
+        """The ``(name, label)`` pairs of the displayed columns."""
+        return [(c.name, c.label) for c in self.columns]
+
+    def get_formatter(self, field_class):
+        """
+        Returns the formatter method for a field class, or ``None`` if the
+        field isn't displayed.
+        """
+        for klass in field_class.__mro__:
+            if klass.__name__ in self.hidden_fields:
+                return None
+            method_name = self._formatter_methods.get(klass.__name__)
+            if method_name is not None:
+                return getattr(self, method_name)
+        return self.format_value
+
+    def row(self, entity):
+        """Returns the :py:class:`DisplayRow` of a single entity."""
+        return self.rows([entity])[0]
+
+    def rows(self, entities):
+        """
+        Returns a :py:class:`DisplayRow` for each entity. The entities
+        referenced by all the rows are fetched with a single batch get.
+        """
+        rows = []
+        references = []
+        for entity in entities:
+            values = []
+            for column in self.columns:
+                value = column.formatter(column, self.get_value(entity, column))
+                if isinstance(value, _Reference):
+                    references.append((values, len(values), value))
+                values.append(value)
+            rows.append(values)
+
+        if references:
+            self._resolve(references)
+
+        return [
+            DisplayRow(self, entity, tuple(values))
+            for entity, values in zip(entities, rows)
+        ]
+
+    def get_value(self, entity, column):
+        """
+        Returns the value of a column for an entity. ``db`` references are
+        read as keys, so the referenced entity isn't fetched for each row.
+        """
+        if not is_ndb_model(entity):
+            from google.appengine.ext import db
+
+            prop = getattr(type(entity), column.name, None)
+            if isinstance(prop, db.ReferenceProperty):
+                return prop.get_value_for_datastore(entity)
+        return getattr(entity, column.name, None)
+
+    def _resolve(self, references):
+        """Replaces the reference placeholders with the entity labels."""
+        keys = []
+        for _, _, reference in references:
+            keys.extend(reference.keys)
+        unique_keys = list(dict.fromkeys(keys))
+        entities = dict(zip(unique_keys, self.backend.get_multi(unique_keys)))
+
+        for values, index, reference in references:
+            get_label = reference.column.get_label
+            labels = [
+                str(get_label(entities[key])) if entities.get(key) else self.blank
+                for key in reference.keys
+            ]
+            if reference.repeated:
+                values[index] = ", ".join(labels)
+            else:
+                values[index] = labels[0]
+
+    def format_value(self, column, value):
+        """Displays a value with ``str()``."""
+        if value is None:
+            return self.blank
+        return str(value)
+
+    def format_DateTimeField(self, column, value):
+        if value is None:
+            return self.blank
+        return value.strftime(column.kwargs.get("format", "%Y-%m-%d %H:%M:%S"))
+
+    def format_SelectField(self, column, value):
+        if value is None:
+            return self.blank
+        choices = dict(column.kwargs.get("choices") or ())
+        return str(choices.get(value, value))
+
+    def format_SelectMultipleField(self, column, value):
+        choices = dict(column.kwargs.get("choices") or ())
+        return ", ".join(str(choices.get(v, v)) for v in value or ())
+
+    def format_StringListPropertyField(self, column, value):
+        return ", ".join(str(v) for v in value or ())
+
+    def format_IntegerListPropertyField(self, column, value):
+        return ", ".join(str(v) for v in value or ())
+
+    def format_JsonPropertyField(self, column, value):
+        if value is None:
+            return self.blank
+        return json.dumps(value)
+
+    def format_KeyPropertyField(self, column, value):
+        if isinstance(value, (list, tuple)):
+            return _Reference(list(value), column, repeated=True)
+        if value is None:
+            return self.blank
+        return _Reference([value], column, repeated=False)
+
+    def format_ReferencePropertyField(self, column, value):
+        return self.format_KeyPropertyField(column, value)
+
+
+def _formatter_methods(cls):
+    """
+    Maps field class names to the names of the formatter methods of a
+    renderer class.
+    """
+    return {name[7:]: name for name in dir(cls) if name.startswith("format_")}
+
+
+DisplayRenderer._formatter_methods = _formatter_methods(DisplayRenderer)
@@ -1,9 +1,50 @@
 import decimal
+import importlib
+import sys
 
 from wtforms import fields
 
-from .db import *
-from .ndb import *
+from ..typed import TypedValues
+
+# Fields are loaded from their submodule on first access, so an app using
+# only ndb never imports the db fields, and vice versa.
+_lazy_fields = {
+    "BlobUploadField": ".blob",
+    "BytesWriter": ".blob",
+    "TemporaryFileWriter": ".blob",
+    "LocalFileWriter": ".blob",
+    "ReferencePropertyField": ".db",
+    "KeyPropertyField": ".ndb",
+    "KeyChoice": ".ndb",
+    "JsonPropertyField": ".ndb",
+    "RepeatedKeyPropertyField": ".ndb",
+    "PrefetchedKeyPropertyField": ".ndb",
+    "RepeatedPrefetchedKeyPropertyField": ".ndb",
+    "StructuredPropertyField": ".ndb",
+}
+
+__all__ = [
+    "GeoPtPropertyField",
+    "StringListPropertyField",
+    "IntegerListPropertyField",
+] + list(_lazy_fields)
+
+
+def __getattr__(name):
+    try:
+        module_name = _lazy_fields[name]
+    except KeyError:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        ) from None
+
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_fields))
 
 
 class GeoPtPropertyField(fields.StringField):
@@ -17,3 +58,61 @@ class GeoPtPropertyField(fields.StringField):
 
             except (decimal.InvalidOperation, ValueError) as exc:
                 raise ValueError("Not a valid coordinate location") from exc
+
+
+class StringListPropertyField(fields.TextAreaField):
+    """
+    A field for ``db.StringListProperty``. The list items are rendered in a
+    textarea. Typed input can give them as a list.
+    """
+
+    def _value(self):
+        if self.raw_data and not isinstance(self.raw_data, TypedValues):
+            return self.raw_data[0]
+        else:
+            return self.data and str("\n".join(self.data)) or ""
+
+    def process_formdata(self, valuelist):
+        if isinstance(valuelist, TypedValues) and isinstance(
+            valuelist.value, (list, tuple)
+        ):
+            self.data = list(valuelist.value)
+        elif valuelist:
+            try:
+                self.data = valuelist[0].splitlines()
+            except ValueError as exc:
+                raise ValueError(self.gettext("Not a valid list")) from exc
+
+
+class IntegerListPropertyField(fields.TextAreaField):
+    """
+    A field for ``db.StringListProperty``. The list items are rendered in a
+    textarea. Typed input can give them as a list.
+    """
+
+    def _value(self):
+        if self.raw_data and not isinstance(self.raw_data, TypedValues):
+            return self.raw_data[0]
+        else:
+            return str("\n".join(self.data)) if self.data else ""
+
+    def process_formdata(self, valuelist):
+        if isinstance(valuelist, TypedValues) and isinstance(
+            valuelist.value, (list, tuple)
+        ):
+            values = valuelist.value
+        elif valuelist:
+            values = valuelist[0].splitlines()
+        else:
+            return
+        try:
+            self.data = [int(value) for value in values]
+        except (TypeError, ValueError) as exc:
+            raise ValueError(self.gettext("Not a valid integer list")) from exc
+
+
+if sys.version_info < (3, 7):
+    # Module __getattr__ isn't supported, load everything up front.
+    from .blob import *  # noqa: E402,F401,F403
+    from .db import *  # noqa: E402,F401,F403
+    from .ndb import *  # noqa: E402,F401,F403
@@ -0,0 +1,171 @@
+import os
+import tempfile
+import uuid
+
+from wtforms import fields
+
+__all__ = [
+    "BlobUploadField",
+    "BytesWriter",
+    "TemporaryFileWriter",
+    "LocalFileWriter",
+]
+
+
+class TemporaryFileWriter:
+    """
+    Spools an upload to an anonymous temporary file.
+
+    The handle returned by :py:meth:`close` is the temporary file itself,
+    rewound to the start, so it can be streamed on to its final destination.
+    It is then owned by the caller, who closes it once done, which deletes it
+    from disk if it was rolled over.
+
+    :param spool_size:
+        Number of bytes kept in memory before the upload is rolled over to
+        disk.
+    """
+
+    def __init__(self, spool_size=64 * 1024):
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_size)
+
+    def write(self, chunk):
+        self.file.write(chunk)
+
+    def close(self):
+        self.file.seek(0)
+        return self.file
+
+    def abort(self):
+        self.file.close()
+
+
+class BytesWriter:
+    """
+    Collects an upload in memory. The handle returned by :py:meth:`close` is
+    the uploaded ``bytes``, as stored by ``db.BlobProperty``.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+
+    def close(self):
+        return b"".join(self.chunks)
+
+    def abort(self):
+        self.chunks = []
+
+
+class LocalFileWriter:
+    """
+    Writes an upload to a file inside ``directory``, standing in for a
+    blobstore or Cloud Storage writer on the local filesystem.
+
+    The handle returned by :py:meth:`close` is the generated file name, which
+    plays the role of a blob key.
+
+    :param directory:
+        Directory the files are written to. It must already exist.
+    """
+
+    def __init__(self, directory):
+        self.key = uuid.uuid4().hex
+        self.path = os.path.join(directory, self.key)
+        self.file = open(self.path, "wb")
+
+    def write(self, chunk):
+        self.file.write(chunk)
+
+    def close(self):
+        self.file.close()
+        return self.key
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.path)
+
+
+class BlobUploadField(fields.FileField):
+    """
+    A file field for ``ndb.BlobKeyProperty`` and ``db.BlobProperty`` which
+    streams the upload in chunks instead of holding it in memory.
+
+    The upload is read ``chunk_size`` bytes at a time and handed to a writer,
+    which is any object with ``write(chunk)``, ``close()`` and ``abort()``
+    methods. ``close()`` returns the handle or key that becomes the field
+    data, and is what ``populate_obj`` sets on the object.
+
+    :param max_size:
+        Maximum upload size in bytes. Larger uploads are aborted as soon as
+        the limit is crossed, and the field fails validation.
+    :param chunk_size:
+        Number of bytes read from the upload at a time.
+    :param writer:
+        A zero-argument callable returning a new writer for each upload.
+        Defaults to :py:class:`TemporaryFileWriter`.
+    """
+
+    def __init__(
+        self,
+        label=None,
+        validators=None,
+        max_size=None,
+        chunk_size=64 * 1024,
+        writer=TemporaryFileWriter,
+        **kwargs
+    ):
+        super().__init__(label, validators, **kwargs)
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.writer = writer
+        self.size = None
+
+    @staticmethod
+    def _get_stream(value):
+        """
+        Returns a readable stream for an uploaded value, or ``None`` if the
+        value isn't an upload (e.g. an empty string for a blank file input).
+        """
+        for attr in ("stream", "file"):
+            stream = getattr(value, attr, None)
+            if stream is not None:
+                return stream
+        if hasattr(value, "read"):
+            return value
+        return None
+
+    def process_formdata(self, valuelist):
+        if not valuelist:
+            return
+
+        stream = self._get_stream(valuelist[0])
+        if stream is None:
+            self.data = None
+            return
+
+        writer = self.writer()
+        size = 0
+        try:
+            while True:
+                chunk = stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if self.max_size is not None and size > self.max_size:
+                    raise ValueError(self.gettext("File is too large"))
+                writer.write(chunk)
+        except BaseException:
+            writer.abort()
+            self.data = None
+            raise
+
+        self.size = size
+        self.data = writer.close()
+
+    def populate_obj(self, obj, name):
+        # A blank file input leaves the stored blob untouched.
+        if self.data is not None:
+            setattr(obj, name, self.data)
@@ -3,6 +3,11 @@ import operator
 from wtforms import fields
 from wtforms import widgets
 
+from . import IntegerListPropertyField
+from . import StringListPropertyField
+from .. import stats
+from ..backends import DBBackend
+
 __all__ = [
     "ReferencePropertyField",
     "StringListPropertyField",
@@ -29,9 +34,15 @@ class ReferencePropertyField(fields.SelectFieldBase):
         to allow `None` to be chosen.
     :param blank_text:
         Use this to override the default blank option's label.
+    :param backend:
+        The backend running the datastore calls, see
+        :py:mod:`wtforms_appengine.backends`. Defaults to a ``DBBackend``.
     """
 
     widget = widgets.Select()
+    backend = DBBackend()
+    # pre_validate() checks the data against the fetched choices.
+    validates_with_datastore = True
 
     def __init__(
         self,
@@ -41,6 +52,7 @@ class ReferencePropertyField(fields.SelectFieldBase):
         get_label=None,
         allow_blank=False,
         blank_text="",
+        backend=None,
         **kwargs
     ):
         super().__init__(label, validators, **kwargs)
@@ -54,8 +66,25 @@ class ReferencePropertyField(fields.SelectFieldBase):
         self.allow_blank = allow_blank
         self.blank_text = blank_text
         self._set_data(None)
+        if backend is not None:
+            self.backend = backend
+        self._query = None
+        self._choices = None
         if reference_class is not None:
-            self.query = reference_class.all()
+            self.query = self.backend.query(reference_class)
+
+    def _get_query(self):
+        if self._choices is None and self._query is not None:
+            self._choices = stats.fetch(self.backend, self._query)
+        return self._choices
+
+    def _set_query(self, query):
+        # Queries are run through the backend once, on first use. Lists of
+        # entities are used as they are.
+        self._query = query
+        self._choices = None if hasattr(query, "run") else query
+
+    query = property(_get_query, _set_query)
 
     def _get_data(self):
         if self._formdata is not None:
@@ -86,7 +115,8 @@ class ReferencePropertyField(fields.SelectFieldBase):
                 self.data = None
             else:
                 self._data = None
-                self._formdata = valuelist[0]
+                # Typed input can give a key.
+                self._formdata = str(valuelist[0])
 
     def pre_validate(self, form):
         data = self.data
@@ -99,43 +129,3 @@ class ReferencePropertyField(fields.SelectFieldBase):
                 raise ValueError(self.gettext("Not a valid choice"))
         elif not self.allow_blank:
             raise ValueError(self.gettext("Not a valid choice"))
-
-
-class StringListPropertyField(fields.TextAreaField):
-    """
-    A field for ``db.StringListProperty``. The list items are rendered in a
-    textarea.
-    """
-
-    def _value(self):
-        if self.raw_data:
-            return self.raw_data[0]
-        else:
-            return self.data and str("\n".join(self.data)) or ""
-
-    def process_formdata(self, valuelist):
-        if valuelist:
-            try:
-                self.data = valuelist[0].splitlines()
-            except ValueError as exc:
-                raise ValueError(self.gettext("Not a valid list")) from exc
-
-
-class IntegerListPropertyField(fields.TextAreaField):
-    """
-    A field for ``db.StringListProperty``. The list items are rendered in a
-    textarea.
-    """
-
-    def _value(self):
-        if self.raw_data:
-            return self.raw_data[0]
-        else:
-            return str("\n".join(self.data)) if self.data else ""
-
-    def process_formdata(self, valuelist):
-        if valuelist:
-            try:
-                self.data = [int(value) for value in valuelist[0].splitlines()]
-            except ValueError as exc:
-                raise ValueError(self.gettext("Not a valid integer list")) from exc
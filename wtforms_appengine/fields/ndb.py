@@ -1,26 +1,57 @@
+import collections
 import json
 import operator
 
 from wtforms import fields
 from wtforms import widgets
+from wtforms.validators import StopValidation
+
+from .. import stats
+from ..backends import NDBBackend
+from ..typed import TypedValues
 
 __all__ = [
     "KeyPropertyField",
+    "KeyChoice",
     "JsonPropertyField",
     "RepeatedKeyPropertyField",
     "PrefetchedKeyPropertyField",
     "RepeatedPrefetchedKeyPropertyField",
+    "StructuredPropertyField",
 ]
 
+#: A choice of a key field with ``compact_choices``.
+KeyChoice = collections.namedtuple("KeyChoice", ["key", "label"])
+
+
+class _CompactFuture:
+    """Compacts the result of a choice future, dropping the entities."""
+
+    def __init__(self, future, compact):
+        self._future = future
+        self._compact = compact
+        self._result = None
+
+    def done(self):
+        return self._future is None or self._future.done()
+
+    def get_result(self):
+        if self._future is not None:
+            self._result = self._compact(self._future.get_result())
+            self._future = None
+        return self._result
+
 
 class KeyPropertyField(fields.SelectFieldBase):
     """
     A field for ``ndb.KeyProperty``. The list items are rendered in a select.
 
     :param ndb.Model reference_class:
-        A Model class which will be used to generate the default query
-        to make the list of items. If this is not specified, The `query`
-        argument must be provided.
+        A Model class, or the kind name of one, which will be used to generate
+        the default query to make the list of items. A kind name is resolved
+        to its model class on first use, so the model's module only has to be
+        imported by then. If this is not specified, The `query` argument must
+        be provided.
     :param  get_label:
         If a string, use this attribute on the model class as the label
         associated with each option. If a one-argument callable, this callable
@@ -32,10 +63,37 @@ class KeyPropertyField(fields.SelectFieldBase):
     :param blank_text:
         Use this to override the default blank option's label.
     :param ndb.Query query:
-        A query to provide a list of valid options.
+        A query to provide a list of valid options, or a callable returning
+        one, which is called when the form is instantiated.
+    :param ancestor:
+        An ancestor key scoping the default query to an entity group, which
+        also makes it strongly consistent. It can be a callable returning the
+        key, which is called when the form is instantiated.
+    :param query_filters:
+        A list of filters of the default query, e.g.
+        ``[Author.city == "Boston"]``.
+    :param query_order:
+        A list of orders of the default query, e.g. ``[Author.name]``. A
+        ``limit`` can be given with ``query_options``.
+    :param query_options:
+        A dictionary of ``ndb`` query options passed to every fetch of the
+        choices, e.g. ``read_policy``, ``batch_size``, ``deadline``,
+        ``use_cache`` or ``use_memcache``.
+    :param backend:
+        The backend running the datastore calls, see
+        :py:mod:`wtforms_appengine.backends`. Defaults to an ``NDBBackend``.
+    :param compact_choices:
+        If true, the fetched entities are reduced to :py:class:`KeyChoice`
+        tuples of their key and label, and dropped. ``query`` then holds the
+        tuples. Labels are computed once, when the choices are fetched.
+        Defaults to the ``compact_choices`` class attribute.
     """
 
     widget = widgets.Select()
+    backend = NDBBackend()
+    compact_choices = False
+    # pre_validate() checks the data against the fetched choices.
+    validates_with_datastore = True
 
     def __init__(
         self,
@@ -46,11 +104,17 @@ class KeyPropertyField(fields.SelectFieldBase):
         allow_blank=False,
         blank_text="",
         query=None,
+        ancestor=None,
+        query_filters=(),
+        query_order=(),
+        query_options=None,
+        backend=None,
+        compact_choices=None,
         **kwargs
     ):
         super().__init__(label, validators, **kwargs)
 
-        if isinstance(get_label, basestring):
+        if isinstance(get_label, str):
             self.get_label = operator.attrgetter(get_label)
         else:
             self.get_label = get_label
@@ -59,17 +123,69 @@ class KeyPropertyField(fields.SelectFieldBase):
         self.blank_text = blank_text
         self._set_data(None)
 
-        if reference_class is not None:
-            query = query or reference_class.query()
-
+        if backend is not None:
+            self.backend = backend
+        if compact_choices is not None:
+            self.compact_choices = compact_choices
+        self.query_options = query_options or {}
+        self._reference_class = reference_class
+        self.ancestor = ancestor() if callable(ancestor) else ancestor
+        self.query_filters = query_filters
+        self.query_order = query_order
+        self._query = None
+        if callable(query):
+            query = query()
         if query:
             self.set_query(query)
 
+    @property
+    def reference_class(self):
+        """
+        The model class of the choices, resolved from its kind name the first
+        time it is needed.
+        """
+        if isinstance(self._reference_class, str):
+            from google.appengine.ext import ndb
+
+            self._reference_class = ndb.Model._lookup_model(self._reference_class)
+        return self._reference_class
+
+    def default_query(self):
+        """
+        Returns the query used when none was given to the constructor.
+        """
+        return self.backend.query(
+            self.reference_class,
+            ancestor=self.ancestor,
+            filters=self.query_filters,
+            order=self.query_order,
+        )
+
     def set_query(self, query):
         # Evaluate and set the query value
         # Setting the query manually will still work, but is not advised
         # as each iteration though it will cause it to be re-evaluated.
-        self.query = query.fetch()
+        self.query = stats.fetch(self.backend, query, **self.query_options)
+
+    def _get_query(self):
+        if self._query is None and self._reference_class is not None:
+            self.set_query(self.default_query())
+        return self._query
+
+    def _set_query(self, query):
+        if self.compact_choices and query is not None:
+            query = self._compact(query)
+        self._query = query
+
+    query = property(_get_query, _set_query)
+
+    def _compact(self, entities):
+        """Returns the :py:class:`KeyChoice` of each entity."""
+        return [KeyChoice(obj.key, self.get_label(obj)) for obj in entities]
+
+    def _label(self, obj):
+        """Returns the label of a choice."""
+        return obj.label if self.compact_choices else self.get_label(obj)
 
     @staticmethod
     def _key_value(key):
@@ -105,7 +221,7 @@ class KeyPropertyField(fields.SelectFieldBase):
 
         for obj in self.query:
             key = self._key_value(obj.key)
-            label = self.get_label(obj)
+            label = self._label(obj)
             yield (key, label, (self.data == obj.key) if self.data else False)
 
     def process_formdata(self, valuelist):
@@ -114,7 +230,19 @@ class KeyPropertyField(fields.SelectFieldBase):
                 self.data = None
             else:
                 self._data = None
-                self._formdata = valuelist[0]
+                self._formdata = self._formdata_value(valuelist[0])
+
+    def _formdata_value(self, value):
+        """
+        Returns the form value of a submitted value, which typed input can
+        give as a key. Tokens given as ``str``, as decoded JSON holds them,
+        are encoded to the ``bytes`` of ``_key_value()``.
+        """
+        if hasattr(value, "urlsafe"):
+            return self._key_value(value)
+        if isinstance(value, str):
+            return value.encode("utf-8")
+        return value
 
     def pre_validate(self, form):
         if self.data is not None:
@@ -138,19 +266,18 @@ class SelectMultipleMixin:
 
         for obj in self.query:
             key = self._key_value(obj.key)
-            label = self.get_label(obj)
+            label = self._label(obj)
             selected = obj.key in data
             yield (key, label, selected)
 
     def process_data(self, value):
         if value:
-            futures = [x.get_async() for x in value]
-            self.data = [x.get_result() for x in futures]
+            self.data = self.backend.get_multi(value)
         else:
             self.data = None
 
     def process_formdata(self, valuelist):
-        self._formdata = valuelist
+        self._formdata = [self._formdata_value(x) for x in valuelist]
 
     def pre_validate(self, form):
         if self.data:
@@ -191,12 +318,21 @@ class PrefetchedKeyPropertyField(KeyPropertyField):
 
     widget = widgets.Select()
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Start the default query right away rather than on first use, so it
+        # runs alongside those of the other fields.
+        self._get_query()
+
     def set_query(self, query):
-        self._query = query.fetch_async()
+        future = stats.fetch_async(self.backend, query, **self.query_options)
+        if self.compact_choices:
+            future = _CompactFuture(future, self._compact)
+        self._query = future
 
     @property
     def query(self):
-        return self._query.get_result()
+        return self._get_query().get_result()
 
 
 class RepeatedPrefetchedKeyPropertyField(
@@ -214,10 +350,68 @@ class JsonPropertyField(fields.StringField):
     widget = widgets.TextArea()
 
     def process_formdata(self, valuelist):
-        if valuelist != "":
-            self.data = json.loads(valuelist[0])
-        else:
-            self.data = None
+        if isinstance(valuelist, TypedValues):
+            # Typed input was already decoded.
+            self.data = valuelist.value
+        elif valuelist:
+            self.data = json.loads(valuelist[0]) if valuelist[0] else None
 
     def _value(self):
         return json.dumps(self.data) if self.data is not None else ""
+
+
+class StructuredPropertyField(fields.FormField):
+    """
+    A field for ``ndb.StructuredProperty`` and ``ndb.LocalStructuredProperty``.
+    The nested model is rendered as a subform.
+
+    :param form_class:
+        The form class generated for the nested model.
+    :param validators:
+        Validators run against the field once the subform is valid. Their
+        errors are reported instead of those of the subform.
+    :param model_class:
+        The nested ``ndb.Model`` class. When populating an object that has no
+        nested entity yet, a new instance of it is created.
+    """
+
+    def __init__(
+        self, form_class, label=None, validators=None, model_class=None, **kwargs
+    ):
+        # FormField rejects validators, they are run by validate() instead.
+        super().__init__(form_class, label, **kwargs)
+        self.validators = list(validators or ())
+        for validator in self.validators:
+            for flag in getattr(validator, "field_flags", ()):
+                setattr(self.flags, flag, True)
+        self.model_class = model_class
+        self.field_errors = []
+
+    def validate(self, form, extra_validators=()):
+        self.field_errors = []
+        if not super().validate(form, extra_validators):
+            return False
+        for validator in self.validators:
+            try:
+                validator(form, self)
+            except StopValidation as e:
+                if e.args and e.args[0]:
+                    self.field_errors.append(e.args[0])
+                break
+            except ValueError as e:
+                self.field_errors.append(e.args[0])
+        return not self.field_errors
+
+    @property
+    def errors(self):
+        return self.field_errors or self.form.errors
+
+    def populate_obj(self, obj, name):
+        candidate = getattr(obj, name, None)
+        if candidate is None:
+            candidate = self._obj
+        if candidate is None:
+            candidate = self.model_class()
+
+        self.form.populate_obj(candidate)
+        setattr(obj, name, candidate)
@@ -0,0 +1,23 @@
+"""
+Fingerprints of choice queries, shared by the choice backends and the query
+stats. This module imports nothing, so that recording stats doesn't load the
+backends.
+"""
+
+
+def query_fingerprint(query, **options):
+    """
+    Returns a hashable fingerprint of a query and its fetch options, equal for
+    queries fetching the same entities.
+    """
+    orders = getattr(query, "orders", None)
+    if orders is not None:
+        # The repr of ndb queries elides the orders.
+        text = "%r %r" % (query, orders)
+    elif type(query).__repr__ is object.__repr__:
+        # db queries only have the default repr, but keep their filters,
+        # orders and ancestor as attributes.
+        text = repr(sorted(vars(query).items()))
+    else:
+        text = repr(query)
+    return (type(query).__name__, text, repr(sorted(options.items())))
@@ -0,0 +1,243 @@
+"""
+Timing hooks for forms, reported to an observer.
+
+Forms extending ``InstrumentedForm`` report how long each phase takes, for the
+whole form and for each field, along with the datastore RPCs made during the
+phase. This makes it possible to tell which reference field ran a query:
+
+.. code-block:: python
+
+   class LoggingObserver(Observer):
+       def field_phase(self, form, field, phase, seconds, rpcs):
+           logging.info("%s.%s: %.3fs %r", field.name, phase, seconds, rpcs)
+
+   set_observer(LoggingObserver())
+   BookForm = model_form(Book, base_class=InstrumentedForm)
+
+Nothing is measured until an observer is set, and instrumented forms then
+behave like plain forms, apart from a global lookup per call.
+"""
+import collections
+import contextlib
+import functools
+import threading
+import time
+
+from wtforms import Form
+from wtforms.meta import DefaultMeta
+
+_observer = None
+
+_local = threading.local()
+
+# The apiproxy the RPC hook was added to. Testbed activations replace it.
+_hooked_apiproxy = None
+
+# Datastore API calls, by the kind of RPC they are counted as.
+_rpc_kinds = {
+    "RunQuery": "query",
+    "Next": "query",
+    "Get": "get",
+    "Put": "put",
+    "Delete": "delete",
+}
+
+# The methods of bound fields timed by instrumented forms.
+_field_phases = ("process", "pre_validate", "validate", "populate_obj")
+
+
+class Observer:
+    """
+    Receives the timings of instrumented forms. The methods do nothing, so
+    subclasses only override those they need.
+
+    ``rpcs`` is a ``collections.Counter`` of the datastore RPCs made during
+    the phase, by kind: ``"query"``, ``"get"``, ``"put"``, ``"delete"``, or
+    the API call name for other calls.
+    """
+
+    def form_generated(self, model, form_class, seconds):
+        """Called after ``model_form()`` generated a form class."""
+
+    def form_phase(self, form, phase, seconds, rpcs):
+        """
+        Called after a phase of an instrumented form: ``"init"`` (binding and
+        processing the fields), ``"process"``, ``"validate"`` or
+        ``"populate_obj"``.
+        """
+
+    def field_phase(self, form, field, phase, seconds, rpcs):
+        """
+        Called after a phase of a field of an instrumented form: ``"bind"``,
+        ``"process"``, ``"pre_validate"``, ``"validate"`` (which includes
+        ``"pre_validate"``), ``"render"`` or ``"populate_obj"``.
+        """
+
+
+def set_observer(observer):
+    """
+    Sets the observer the timings are reported to, process-wide. ``None``
+    turns the instrumentation off.
+    """
+    global _observer
+    _observer = observer
+
+
+def get_observer():
+    """Returns the current observer, or ``None``."""
+    return _observer
+
+
+def record_rpc(kind):
+    """
+    Counts a datastore RPC in the counters of the current thread. Called for
+    the datastore API calls, and by backends that don't go through it.
+    """
+    for counter in getattr(_local, "counters", ()):
+        counter[kind] += 1
+
+
+def _rpc_hook(service, call, request, response, rpc=None):
+    record_rpc(_rpc_kinds.get(call, call))
+
+
+def _install_rpc_hook():
+    global _hooked_apiproxy
+    from google.appengine.api import apiproxy_stub_map
+
+    apiproxy = apiproxy_stub_map.apiproxy
+    if apiproxy is not _hooked_apiproxy:
+        hooks = apiproxy.GetPreCallHooks()
+        hooks.Append("wtforms_appengine.instrument", _rpc_hook, "datastore_v3")
+        _hooked_apiproxy = apiproxy
+
+
+@contextlib.contextmanager
+def count_rpcs():
+    """
+    Counts the datastore RPCs made by the current thread inside the block.
+    Yields a ``collections.Counter`` of the RPCs by kind.
+
+    RPCs are counted when they are issued: an asynchronous query started in
+    the block and waited for after it is counted.
+    """
+    _install_rpc_hook()
+    counter = collections.Counter()
+    counters = _local.__dict__.setdefault("counters", [])
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+def _timed(func, report):
+    """
+    Wraps ``func`` to call ``report(seconds, rpcs)`` after each call, even if
+    it raises.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with count_rpcs() as rpcs:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                report(time.perf_counter() - start, rpcs)
+
+    return wrapper
+
+
+def reports_generation(model_form):
+    """
+    Decorates a ``model_form()`` function to report the generated form
+    classes to the observer.
+    """
+
+    @functools.wraps(model_form)
+    def wrapper(model, *args, **kwargs):
+        observer = _observer
+        if observer is None:
+            return model_form(model, *args, **kwargs)
+
+        start = time.perf_counter()
+        form_class = model_form(model, *args, **kwargs)
+        observer.form_generated(model, form_class, time.perf_counter() - start)
+        return form_class
+
+    return wrapper
+
+
+class InstrumentedMeta(DefaultMeta):
+    """
+    Times the binding and rendering of the fields, and wraps the timed
+    methods of each bound field.
+    """
+
+    def bind_field(self, form, unbound_field, options):
+        observer = _observer
+        if observer is None:
+            return super().bind_field(form, unbound_field, options)
+
+        # Each form has its own meta instance, remember the form for
+        # render_field().
+        self._form = form
+        with count_rpcs() as rpcs:
+            start = time.perf_counter()
+            field = super().bind_field(form, unbound_field, options)
+            seconds = time.perf_counter() - start
+        observer.field_phase(form, field, "bind", seconds, rpcs)
+
+        for phase in _field_phases:
+            report = functools.partial(observer.field_phase, form, field, phase)
+            # Shadows the method on the instance, so calls made by the form
+            # and by the field itself are timed.
+            setattr(field, phase, _timed(getattr(field, phase), report))
+        return field
+
+    def render_field(self, field, render_kw):
+        observer = _observer
+        if observer is None:
+            return super().render_field(field, render_kw)
+
+        form = getattr(self, "_form", None)
+        report = functools.partial(observer.field_phase, form, field, "render")
+        return _timed(super().render_field, report)(field, render_kw)
+
+
+class InstrumentedForm(Form):
+    """
+    A form reporting the timings of its phases, and of those of its fields,
+    to the observer set with :py:func:`set_observer`.
+
+    Use it as the ``base_class`` of ``model_form()``, or as the base class of
+    hand-written forms.
+    """
+
+    Meta = InstrumentedMeta
+
+    def __init__(self, *args, **kwargs):
+        observer = _observer
+        if observer is None:
+            super().__init__(*args, **kwargs)
+            return
+
+        report = functools.partial(observer.form_phase, self, "init")
+        _timed(super().__init__, report)(*args, **kwargs)
+
+    def _run(self, phase, method, *args, **kwargs):
+        observer = _observer
+        if observer is None:
+            return method(*args, **kwargs)
+        report = functools.partial(observer.form_phase, self, phase)
+        return _timed(method, report)(*args, **kwargs)
+
+    def process(self, *args, **kwargs):
+        return self._run("process", super().process, *args, **kwargs)
+
+    def validate(self, *args, **kwargs):
+        return self._run("validate", super().validate, *args, **kwargs)
+
+    def populate_obj(self, obj):
+        return self._run("populate_obj", super().populate_obj, obj)
@@ -95,12 +95,15 @@ from wtforms import fields as f
 from wtforms import Form
 from wtforms import validators
 
+from .fields import BlobUploadField
 from .fields import GeoPtPropertyField
 from .fields import IntegerListPropertyField
 from .fields import JsonPropertyField
 from .fields import KeyPropertyField
 from .fields import RepeatedKeyPropertyField
 from .fields import StringListPropertyField
+from .fields import StructuredPropertyField
+from .instrument import reports_generation
 
 
 def get_StringField(kwargs):
@@ -123,20 +126,73 @@ def get_IntegerField(kwargs):
 
 
 class ModelConverterBase:
-    def __init__(self, converters=None):
+    # Maps property class names to converter method names, computed once for
+    # each converter class from its ``convert_<PropertyClass>`` methods.
+    _converter_methods = {}
+    # Property class -> names of the classes in its MRO, filled on first use.
+    _dispatch_cache = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._converter_methods = {
+            name[8:]: name for name in dir(cls) if name.startswith("convert_")
+        }
+        cls._dispatch_cache = {}
+
+    def __init__(self, converters=None, query_options=None):
         """
         Constructs the converter, setting the converter callables.
 
         :param converters:
             A dictionary of converter callables for each property type. The
-            callable must accept the arguments (model, prop, kwargs).
+            callable must accept the arguments (model, prop, kwargs). These
+            take precedence over the ``convert_<Property>`` methods, which
+            ``self.converters`` holds too.
+        :param query_options:
+            Default ``query_options`` of the generated ``KeyPropertyField``
+            fields, used unless given in their ``field_args``.
+        """
+        self.converters = self._method_converters()
+        if converters:
+            self.converters.update(converters)
+        self.query_options = query_options
+
+    def _method_converters(self):
+        """Returns the converter methods by property class name."""
+        return {
+            name: getattr(self, method)
+            for name, method in self._converter_methods.items()
+        }
+
+    def get_converter(self, prop_type):
         """
-        self.converters = {}
+        Returns the converter callable for a property class.
+
+        The property class MRO is walked so subclasses of the known properties
+        are converted like their base class. The MRO names are cached for each
+        converter class. ``fallback_converter`` is returned if no converter is
+        found.
+
+        :param prop_type:
+            The property class, or the name of a property class.
+        """
+        if isinstance(prop_type, str):
+            names = (prop_type,)
+        else:
+            names = self._dispatch_cache.get(prop_type)
+            if names is None:
+                names = tuple(klass.__name__ for klass in prop_type.__mro__)
+                self._dispatch_cache[prop_type] = names
 
-        for name in dir(self):
-            if not name.startswith("convert_"):
-                continue
-            self.converters[name[8:]] = getattr(self, name)
+        for name in names:
+            converter = self.converters.get(name)
+            if converter is not None:
+                return converter
+        return self.fallback_converter
+
+    def fallback_converter(self, model, prop, kwargs):
+        """Skips properties without a converter."""
+        return None
 
     def convert(self, model, prop, field_args):
         """
@@ -150,7 +206,8 @@ class ModelConverterBase:
             Optional keyword arguments to construct the field.
         """
 
-        prop_type_name = type(prop).__name__
+        prop_type = type(prop)
+        prop_type_name = prop_type.__name__
 
         # check for generic property
         if prop_type_name == "GenericProperty":
@@ -158,7 +215,8 @@ class ModelConverterBase:
             generic_type = field_args.get("type") if field_args else None
 
             if generic_type:
-                prop_type_name = field_args.get("type")
+                prop_type = prop_type_name = generic_type
+                field_args = {k: v for k, v in field_args.items() if k != "type"}
             # if no type is found, the generic property uses string set in
             # convert_GenericProperty
 
@@ -169,11 +227,17 @@ class ModelConverterBase:
         }
         if field_args:
             kwargs.update(field_args)
+            # Don't add to the caller's list, which may be shared by forms.
+            kwargs["validators"] = list(kwargs["validators"])
 
         if prop._required and prop_type_name not in self.NO_AUTO_REQUIRED:
             kwargs["validators"].append(validators.required())
 
         choices = kwargs.get("choices", None) or prop._choices
+        if isinstance(choices, frozenset):
+            # NDB keeps the choices in a frozenset, sort them so the order is
+            # the same from one instance to the next.
+            choices = sorted(choices)
         if choices:
             # Use choices in a select field.
             kwargs["choices"] = [(v, v) for v in choices]
@@ -183,11 +247,7 @@ class ModelConverterBase:
                 return f.SelectField(**kwargs)
 
         else:
-            converter = self.converters.get(prop_type_name, None)
-            if converter is not None:
-                return converter(model, prop, kwargs)
-            else:
-                return self.fallback_converter(model, prop, kwargs)
+            return self.get_converter(prop_type)(model, prop, kwargs)
 
 
 class ModelConverter(ModelConverterBase):
@@ -223,13 +283,16 @@ class ModelConverter(ModelConverterBase):
     +--------------------+-------------------+--------------+------------------+
     | KeyProperty        | KeyProperyField   | ndb.Key      |                  |
     +--------------------+-------------------+--------------+------------------+
-    | BlobKeyProperty    | None              | ndb.BlobKey  | always skipped   |
+    | BlobKeyProperty    | BlobUploadField   | ndb.BlobKey  | FileField        |
+    |                    |                   |              | without a writer |
     +--------------------+-------------------+--------------+------------------+
     | UserProperty       | None              | users.User   | always skipped   |
     +--------------------+-------------------+--------------+------------------+
-    | StructuredProperty | None              | ndb.Model    | always skipped   |
+    | StructuredProperty | StructuredProp... | ndb.Model    | FieldList if     |
+    |                    |                   |              | repeated         |
     +--------------------+-------------------+--------------+------------------+
-    | LocalStructuredPro | None              | ndb.Model    | always skipped   |
+    | LocalStructuredPro | StructuredProp... | ndb.Model    | FieldList if     |
+    |                    |                   |              | repeated         |
     +--------------------+-------------------+--------------+------------------+
     | JsonProperty       | JsonPropertyField | datastucture |                  |
     +--------------------+-------------------+--------------+------------------+
@@ -300,11 +363,36 @@ class ModelConverter(ModelConverterBase):
 
     def convert_StructuredProperty(self, model, prop, kwargs):
         """Returns a form field for a ``ndb.StructuredProperty``."""
-        return None
+        return self.get_StructuredField(prop, kwargs)
 
     def convert_LocalStructuredProperty(self, model, prop, kwargs):
         """Returns a form field for a ``ndb.LocalStructuredProperty``."""
-        return None
+        return self.get_StructuredField(prop, kwargs)
+
+    def get_StructuredField(self, prop, kwargs):
+        """
+        Returns a ``StructuredPropertyField`` (wrapped in a ``FieldList`` if
+        the property is repeated) for the nested model class.
+
+        The ``only``, ``exclude`` and ``field_args`` keys of ``kwargs`` are
+        used to generate the subform. Subform classes are cached per
+        converter, model class and options, so they are built only once.
+        """
+        options = {
+            "only": kwargs.pop("only", None),
+            "exclude": kwargs.pop("exclude", None),
+            "field_args": kwargs.pop("field_args", None),
+        }
+        form_class = get_subform(prop._modelclass, self, **options)
+
+        if prop._repeated:
+            subfield = StructuredPropertyField(form_class, model_class=prop._modelclass)
+            if kwargs.get("default") is None:
+                kwargs["default"] = ()
+            return f.FieldList(subfield, **kwargs)
+        return StructuredPropertyField(
+            form_class, model_class=prop._modelclass, **kwargs
+        )
 
     def convert_JsonProperty(self, model, prop, kwargs):
         """Returns a form field for a ``ndb.JsonProperty``."""
@@ -320,8 +408,14 @@ class ModelConverter(ModelConverterBase):
         return get_StringField(kwargs)
 
     def convert_BlobKeyProperty(self, model, prop, kwargs):
-        """Returns a form field for a ``ndb.BlobKeyProperty``."""
-        return f.FileField(**kwargs)
+        """
+        Returns a form field for a ``ndb.BlobKeyProperty``. Without a
+        ``writer`` storing the uploads and returning their ``BlobKey`` in the
+        field args, it is a plain ``FileField``.
+        """
+        if kwargs.get("writer") is None:
+            return f.FileField(**kwargs)
+        return BlobUploadField(**kwargs)
 
     def convert_TextProperty(self, model, prop, kwargs):
         """Returns a form field for a ``ndb.TextProperty``."""
@@ -343,17 +437,18 @@ class ModelConverter(ModelConverterBase):
             except AttributeError:
                 reference_class = prop._reference_class
 
-            if isinstance(reference_class, str):
-                # This assumes that the referenced module is already imported.
-                try:
-                    reference_class = model._kind_map[reference_class]
-                except KeyError:
-                    # If it's not imported, just bail, as we can't
-                    # edit this field safely.
-                    return None
+            if reference_class is None and "query" not in kwargs:
+                # Without a kind there's no way to list the choices, so
+                # we can't edit this field safely.
+                return None
+
+            # Kind names are resolved by the field on first use, so the
+            # referenced module doesn't have to be imported yet.
             kwargs["reference_class"] = reference_class
 
         kwargs.setdefault("allow_blank", not prop._required)
+        if self.query_options is not None:
+            kwargs.setdefault("query_options", self.query_options)
 
         if prop._repeated:
             return RepeatedKeyPropertyField(**kwargs)
@@ -365,6 +460,70 @@ class ModelConverter(ModelConverterBase):
         return None
 
 
+_subform_cache = {}
+
+
+def _freeze(value):
+    """
+    Returns a hashable version of ``value`` to be used as a cache key.
+
+    Raises ``TypeError`` for anything but plain values and containers of them.
+    Objects such as validators or functions only compare by identity, and an
+    id can be reused once they are collected.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if value is None or isinstance(value, (str, bytes, int, float)):
+        return value
+    raise TypeError("Can't freeze %r" % (value,))
+
+
+def get_subform(model, converter=None, only=None, exclude=None, field_args=None):
+    """
+    Returns a cached form class for a model nested in a
+    ``ndb.StructuredProperty``, generating it on first use.
+
+    The arguments are the same as for ``model_form()``. The form class is
+    shared by every parent form and request using the same options.
+    """
+    converter = converter or default_converter
+    cache_key = None
+    # Converters given callables don't share their subforms.
+    if converter.converters == converter._method_converters():
+        try:
+            cache_key = (
+                type(converter),
+                _freeze(converter.query_options),
+                model,
+                _freeze(only),
+                _freeze(exclude),
+                _freeze(field_args),
+            )
+        except TypeError:
+            # The options hold objects such as validators, don't cache.
+            pass
+
+    form_class = _subform_cache.get(cache_key) if cache_key else None
+    if form_class is None:
+        form_class = model_form(
+            model,
+            only=only,
+            exclude=exclude,
+            field_args=field_args,
+            converter=converter,
+        )
+        if cache_key:
+            form_class = _subform_cache.setdefault(cache_key, form_class)
+    return form_class
+
+
+default_converter = ModelConverter()
+
+
 def model_fields(model, only=None, exclude=None, field_args=None, converter=None):
     """
     Extracts and returns a dictionary of form fields for a given
@@ -383,9 +542,9 @@ def model_fields(model, only=None, exclude=None, field_args=None, converter=None
         used to construct each field object.
     :param converter:
         A converter to generate the fields based on the model properties. If
-        not set, ``ModelConverter`` is used.
+        not set, a shared ``ModelConverter`` instance is used.
     """
-    converter = converter or ModelConverter()
+    converter = converter or default_converter
     field_args = field_args or {}
 
     # Get the field names we want to include or exclude, starting with the
@@ -410,6 +569,7 @@ def model_fields(model, only=None, exclude=None, field_args=None, converter=None
     return field_dict
 
 
+@reports_generation
 def model_form(
     model,
     base_class=Form,
@@ -440,7 +600,7 @@ def model_form(
         used to construct each field object.
     :param converter:
         A converter to generate the fields based on the model properties. If
-        not set, ``ModelConverter`` is used.
+        not set, a shared ``ModelConverter`` instance is used.
     """
     # Extract the fields from the model.
     field_dict = model_fields(model, only, exclude, field_args, converter)
@@ -0,0 +1,244 @@
+"""
+Process-wide statistics of the choice queries run by the reference fields.
+
+Once enabled, every fetch made by ``KeyPropertyField``, its repeated and
+prefetched variants and ``ReferencePropertyField`` is recorded under the
+fingerprint of its query. The aggregated numbers can be dumped from an admin
+handler to find the forms pulling large choice lists:
+
+.. code-block:: python
+
+   from wtforms_appengine import stats
+
+   stats.registry.enabled = True
+
+   class StatsHandler(webapp2.RequestHandler):
+       def get(self):
+           self.response.write(json.dumps(stats.snapshot(), indent=2))
+"""
+import collections
+import threading
+import time
+
+from .fingerprint import query_fingerprint
+
+
+def _entity_size(entity):
+    """
+    Returns the encoded size of an ``ndb`` or ``db`` entity, or of the key
+    returned by a ``keys_only`` query, in bytes.
+    """
+    to_pb = getattr(entity, "_to_pb", None)
+    if to_pb is not None:
+        return to_pb().ByteSize()
+    reference = getattr(entity, "reference", None)
+    if reference is not None:
+        # An ndb key.
+        return reference().ByteSize()
+    to_pb = getattr(entity, "_ToPb", None)
+    if to_pb is not None:
+        # A db key.
+        return to_pb().ByteSize()
+    from google.appengine.ext import db
+
+    return db.model_to_protobuf(entity).ByteSize()
+
+
+def _label(key):
+    """Returns the text of a query fingerprint."""
+    _, text, options = key
+    return text if options == "[]" else "%s %s" % (text, options)
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class QueryStats:
+    """
+    The aggregated fetches of a query.
+
+    :param max_samples:
+        Number of latencies kept for the percentiles, the most recent ones.
+    """
+
+    __slots__ = (
+        "runs",
+        "results",
+        "last_results",
+        "max_results",
+        "entity_bytes",
+        "bytes_fetched",
+        "latencies",
+    )
+
+    def __init__(self, max_samples):
+        self.runs = 0
+        self.results = 0
+        self.last_results = 0
+        self.max_results = 0
+        self.entity_bytes = None
+        self.bytes_fetched = 0
+        self.latencies = collections.deque(maxlen=max_samples)
+
+    def as_dict(self):
+        ordered = sorted(self.latencies)
+        return {
+            "runs": self.runs,
+            "results": self.results,
+            "last_results": self.last_results,
+            "max_results": self.max_results,
+            "entity_bytes": self.entity_bytes,
+            "bytes_fetched": self.bytes_fetched,
+            "latency_p50": _percentile(ordered, 0.5),
+            "latency_p90": _percentile(ordered, 0.9),
+            "latency_p99": _percentile(ordered, 0.99),
+            "latency_max": ordered[-1],
+        }
+
+
+class StatsRegistry:
+    """
+    Collects :py:class:`QueryStats` by query fingerprint.
+
+    Fetches are only recorded while :py:attr:`enabled` is true. The stats of
+    at most ``max_queries`` queries are kept, those of the least recently
+    fetched query being dropped first, so queries scoped by a per-request
+    ancestor or filter don't grow the registry without bound.
+
+    Measuring the encoded size of the entities isn't free, so it is done on
+    the first fetch of a query and then every ``size_every`` fetches, from a
+    sample of ``size_sample`` entities. The bytes fetched are estimated from
+    the last measured average entity size.
+
+    :param max_samples:
+        Number of latencies kept for each query.
+    :param size_every:
+        Number of fetches between two measures of the entity size.
+    :param max_queries:
+        Number of queries whose stats are kept.
+    :param size_sample:
+        Number of entities encoded to measure the entity size.
+    :param enabled:
+        Initial value of :py:attr:`enabled`.
+    """
+
+    def __init__(
+        self,
+        max_samples=1000,
+        size_every=100,
+        max_queries=1000,
+        size_sample=10,
+        enabled=False,
+    ):
+        self.max_samples = max_samples
+        self.size_every = size_every
+        self.max_queries = max_queries
+        self.size_sample = size_sample
+        #: Whether the fields record their fetches.
+        self.enabled = enabled
+        #: Number of queries whose stats were dropped to stay under
+        #: ``max_queries``.
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._stats = collections.OrderedDict()
+
+    def record(self, query, options, entities, seconds):
+        """Records a fetch of ``query`` that returned ``entities``."""
+        key = query_fingerprint(query, **options)
+        count = len(entities)
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QueryStats(self.max_samples)
+                while len(self._stats) > self.max_queries:
+                    self._stats.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._stats.move_to_end(key)
+            stats.runs += 1
+            measure = count > 0 and (
+                stats.entity_bytes is None or stats.runs % self.size_every == 0
+            )
+
+        if measure:
+            step = max(1, count // self.size_sample)
+            sample = entities[::step][: self.size_sample]
+            size = sum(_entity_size(entity) for entity in sample) // len(sample)
+
+        with self._lock:
+            if measure:
+                stats.entity_bytes = size
+            stats.results += count
+            stats.last_results = count
+            stats.max_results = max(stats.max_results, count)
+            stats.bytes_fetched += count * (stats.entity_bytes or 0)
+            stats.latencies.append(seconds)
+
+    def snapshot(self):
+        """
+        Returns a dict with the stats of each query, by the text of its
+        fingerprint. Latencies are in seconds.
+        """
+        with self._lock:
+            items = [(key, stats.as_dict()) for key, stats in self._stats.items()]
+        return {_label(key): stats for key, stats in items}
+
+    def reset(self):
+        """Forgets the recorded stats."""
+        with self._lock:
+            self._stats.clear()
+            self.evicted = 0
+
+
+#: The registry the fields record their fetches in.
+registry = StatsRegistry()
+
+
+def snapshot():
+    """Returns the stats of the process-wide registry."""
+    return registry.snapshot()
+
+
+def fetch(backend, query, **options):
+    """Fetches ``query`` with ``backend``, recording the fetch if enabled."""
+    if not registry.enabled:
+        return backend.fetch(query, **options)
+    start = time.perf_counter()
+    entities = backend.fetch(query, **options)
+    registry.record(query, options, entities, time.perf_counter() - start)
+    return entities
+
+
+class _RecordedFuture:
+    """Records a fetch the first time its result is waited for."""
+
+    def __init__(self, future, query, options, start):
+        self.future = future
+        self.query = query
+        self.options = options
+        self.start = start
+
+    def done(self):
+        return self.future.done()
+
+    def get_result(self):
+        entities = self.future.get_result()
+        if self.query is not None:
+            seconds = time.perf_counter() - self.start
+            registry.record(self.query, self.options, entities, seconds)
+            self.query = None
+        return entities
+
+
+def fetch_async(backend, query, **options):
+    """
+    Starts fetching ``query`` with ``backend``, returning a future recording
+    the fetch once its result is ready, if enabled.
+    """
+    if not registry.enabled:
+        return backend.fetch_async(query, **options)
+    start = time.perf_counter()
+    future = backend.fetch_async(query, **options)
+    return _RecordedFuture(future, query, options, start)
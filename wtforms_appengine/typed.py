@@ -0,0 +1,93 @@
+"""
+Typed input for forms processing decoded JSON rather than posted strings.
+
+Forms extending ``TypedForm`` take the decoded body of an API request as
+their form data. Values are given with their own type: lists for the repeated
+fields, dicts for ``JsonPropertyField`` and structured properties, and keys
+or urlsafe keys for the key fields. Fields that support it take these values
+as they are, without the string round trip of a posted form:
+
+.. code-block:: python
+
+   BookForm = model_form(Book, base_class=TypedForm)
+
+   class BookHandler(webapp2.RequestHandler):
+       def post(self):
+           form = BookForm(json.loads(self.request.body))
+           if form.validate():
+               ...
+
+Any form can also be given a ``TypedInput`` as its form data. Missing keys are
+handled like missing form inputs, and ``None`` values like empty ones.
+"""
+from wtforms import Form
+from wtforms.meta import DefaultMeta
+
+
+class TypedValues(list):
+    """
+    The values of a field in a :py:class:`TypedInput`, as the list fields
+    take them: the items of a list, or a list of a single value.
+    :py:attr:`value` is the value as it was given.
+    """
+
+    def __init__(self, value):
+        if isinstance(value, (list, tuple)):
+            super().__init__(value)
+        else:
+            super().__init__(["" if value is None else value])
+        self.value = value
+
+
+class TypedInput(dict):
+    """
+    Wraps a dict of typed values to be used as the form data of any form.
+
+    Nested dicts and lists are also available under the prefixed names of
+    the subform and ``FieldList`` fields, e.g. ``address-city`` and
+    ``tags-0``.
+
+    :param data:
+        The dict of values, by field name.
+    :param separator:
+        The separator of the names of nested fields.
+    """
+
+    def __init__(self, data, separator="-"):
+        super().__init__()
+        self.separator = separator
+        self._add("", data)
+
+    def _add(self, prefix, data):
+        for name, value in data.items():
+            name = prefix + str(name)
+            self[name] = value
+            if isinstance(value, dict):
+                self._add(name + self.separator, value)
+            elif isinstance(value, (list, tuple)):
+                items = {str(i): item for i, item in enumerate(value)}
+                self._add(name + self.separator, items)
+
+    def getlist(self, key):
+        return TypedValues(self[key])
+
+
+class TypedMeta(DefaultMeta):
+    """Wraps the dicts given as form data in a :py:class:`TypedInput`."""
+
+    def wrap_formdata(self, form, formdata):
+        if isinstance(formdata, dict) and not hasattr(formdata, "getlist"):
+            return TypedInput(formdata)
+        return super().wrap_formdata(form, formdata)
+
+
+class TypedForm(Form):
+    """
+    A form taking a dict of typed values as form data, such as a decoded
+    JSON request body.
+
+    Use it as the ``base_class`` of ``model_form()``, or as the base class of
+    hand-written forms.
+    """
+
+    Meta = TypedMeta
@@ -0,0 +1,57 @@
+"""
+Helpers working with both ``ndb`` and ``db`` models.
+"""
+
+
+def is_ndb_model(model):
+    """
+    Returns true if ``model`` is an ``ndb`` model class or instance, false if
+    it is a ``db`` one.
+    """
+    return hasattr(model, "_get_kind")
+
+
+def get_kind(model):
+    """
+    Returns the kind of an ``ndb`` or ``db`` model class or instance.
+    """
+    if is_ndb_model(model):
+        return model._get_kind()
+    return model.kind()
+
+
+def model_fields(model, **options):
+    """
+    Calls ``model_fields()`` from the module matching the library of
+    ``model``.
+    """
+    if is_ndb_model(model):
+        from .ndb import model_fields
+    else:
+        from .db import model_fields
+    return model_fields(model, **options)
+
+
+def model_form(model, **options):
+    """
+    Calls ``model_form()`` from the module matching the library of ``model``.
+    """
+    if is_ndb_model(model):
+        from .ndb import model_form
+    else:
+        from .db import model_form
+    return model_form(model, **options)
+
+
+def key_fields(form_class):
+    """
+    Yields the ``(name, unbound field)`` pairs of the ``KeyPropertyField``
+    fields of a form class.
+    """
+    from .fields.ndb import KeyPropertyField
+
+    for name in dir(form_class):
+        field = getattr(form_class, name)
+        field_class = getattr(field, "field_class", None)
+        if isinstance(field_class, type) and issubclass(field_class, KeyPropertyField):
+            yield name, field
@@ -0,0 +1,93 @@
+"""
+Fail-fast validation, checking the choices of reference fields last.
+
+Forms extending ``FailFastForm`` validate the fields that don't need the
+datastore first. The key and reference fields, whose ``pre_validate`` checks
+the submitted value against the fetched choices, are validated after them,
+and only while the form is still valid. A submission failing a
+``validators.required()`` or length check then doesn't run their choice
+queries:
+
+.. code-block:: python
+
+   BookForm = model_form(Book, base_class=FailFastForm)
+
+   form = BookForm(request.POST)
+   if not form.validate():
+       # form.skipped_fields lists the fields that weren't validated.
+       ...
+
+Reads made before validation still happen: the prefetched key fields run
+their query when the form is built, and ``RepeatedKeyPropertyField`` gets the
+entities of the keys of the object the form is built with.
+
+Set ``collect_all_errors`` on the form class, or pass it to ``validate()``, to
+validate every field anyway and report all the errors.
+"""
+from wtforms import Form
+from wtforms.form import BaseForm
+
+
+def uses_datastore(field):
+    """
+    Returns true if validating the bound ``field`` may query the datastore:
+    it is a key or reference field, or a subform or ``FieldList`` holding
+    one.
+    """
+    if getattr(field, "validates_with_datastore", False):
+        return True
+    form = getattr(field, "form", None)
+    if isinstance(form, BaseForm):
+        return any(uses_datastore(x) for x in form)
+    return any(uses_datastore(x) for x in getattr(field, "entries", ()))
+
+
+class FailFastForm(Form):
+    """
+    A form validating the fields that query the datastore last, and
+    skipping them once another field failed.
+
+    Use it as the ``base_class`` of ``model_form()``, or as the base class of
+    hand-written forms.
+    """
+
+    #: If true, every field is validated, even once the form is invalid.
+    collect_all_errors = False
+
+    #: The names of the fields skipped by the last call to ``validate()``.
+    skipped_fields = ()
+
+    def validate(self, extra_validators=None, collect_all_errors=None):
+        """
+        Validates the form like ``Form.validate()``, the fields querying the
+        datastore last.
+
+        :param extra_validators:
+            A dict mapping field names to lists of extra validators.
+        :param collect_all_errors:
+            Overrides the ``collect_all_errors`` class attribute.
+        """
+        if collect_all_errors is None:
+            collect_all_errors = self.collect_all_errors
+        extra = dict(extra_validators or {})
+        for name in self._fields:
+            inline = getattr(self.__class__, "validate_%s" % name, None)
+            if inline is not None:
+                extra[name] = list(extra.get(name, ())) + [inline]
+
+        success = True
+        deferred = []
+        for name, field in self._fields.items():
+            if uses_datastore(field):
+                deferred.append(name)
+            elif not field.validate(self, extra.get(name, ())):
+                success = False
+
+        skipped = []
+        for name in deferred:
+            if not success and not collect_all_errors:
+                skipped.append(name)
+            elif not self._fields[name].validate(self, extra.get(name, ())):
+                success = False
+        self.skipped_fields = tuple(skipped)
+        return success
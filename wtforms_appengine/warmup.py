@@ -0,0 +1,205 @@
+"""
+Moves the first-request cost of forms to instance startup.
+
+Apps declare their forms and reference queries on a ``WarmupRegistry`` when
+their modules are imported, and call ``warm()`` from the ``/_ah/warmup``
+handler:
+
+.. code-block:: python
+
+   registry = WarmupRegistry()
+   registry.register_form("contact", Contact, exclude=("is_admin",))
+   registry.register_query("cities", City.query().order(City.name))
+
+   # In the /_ah/warmup handler.
+   for item in registry.warm():
+       logging.info("Warmed %(name)s in %(seconds).3fs", item)
+
+   # In a request handler.
+   ContactForm = registry.get_form("contact")
+
+``warm()`` builds every form class, resolves the model classes referenced by
+their ``KeyPropertyField`` kinds, and fetches the registered queries and the
+choice queries of the reference fields concurrently.
+
+The choices are fetched through the backend of each field, with its query
+options, so a caching backend serves them to the first request. With the
+default ``NDBBackend``, the first request fetches them again, and warming only
+builds the form classes. The registry can give a caching backend to the key
+fields that don't set their own:
+
+.. code-block:: python
+
+   backend = StaleWhileRevalidateBackend(NDBBackend(), max_age=300)
+   registry = WarmupRegistry(backend=backend)
+"""
+import threading
+import time
+
+from .backends import NDBBackend
+from .utils import key_fields
+from .utils import model_form
+
+
+class WarmupRegistry:
+    """
+    Collects form specs and queries to warm up at instance start.
+
+    :param backend:
+        A backend given to the key fields of the registered forms that don't
+        set their own, and fetching the registered queries. Prefetching only
+        spares the first request its queries if this backend keeps their
+        results, like ``StaleWhileRevalidateBackend`` and
+        ``IncrementalChoicesBackend`` do.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._specs = {}
+        self._queries = {}
+        self._forms = {}
+        self._lock = threading.Lock()
+        #: Results of the prefetched queries, by name. The fields don't read
+        #: them: they only get the warmed choices from a caching ``backend``.
+        self.choices = {}
+
+    def register_form(self, name, model, prefetch=True, **options):
+        """
+        Declares a form, built by ``model_form(model, **options)``.
+
+        :param name:
+            Name used to get the form class with :py:meth:`get_form`.
+        :param prefetch:
+            If true, the choice queries of the form's ``KeyPropertyField``
+            fields are fetched by :py:meth:`warm`.
+        """
+        self._specs[name] = (model, prefetch, options)
+
+    def register_query(self, name, query):
+        """
+        Declares an ``ndb.Query`` to be fetched by :py:meth:`warm`.
+        """
+        self._queries[name] = query
+
+    def get_form(self, name):
+        """
+        Returns the form class registered as ``name``, building it if the
+        registry wasn't warmed yet.
+        """
+        form_class = self._forms.get(name)
+        if form_class is None:
+            model, _, options = self._specs[name]
+            form_class = model_form(model, **options)
+            _resolve_reference_classes(form_class)
+            if self.backend is not None:
+                for _, field in key_fields(form_class):
+                    field.kwargs.setdefault("backend", self.backend)
+            with self._lock:
+                form_class = self._forms.setdefault(name, form_class)
+        return form_class
+
+    def warm(self):
+        """
+        Builds the registered form classes and fetches their choice lists.
+
+        Returns a list with a dict for each form and query, with its
+        ``name``, ``type`` (``"form"`` or ``"query"``), the ``seconds`` it
+        took, and the ``error`` it raised, if any.
+        """
+        report = []
+        backend = self.backend or NDBBackend()
+        queries = {name: (backend, x, {}) for name, x in self._queries.items()}
+
+        for name, (_, prefetch, _) in self._specs.items():
+            start = time.perf_counter()
+            item = {"name": name, "type": "form"}
+            try:
+                form_class = self.get_form(name)
+            except Exception as exc:
+                item["error"] = exc
+            else:
+                if prefetch:
+                    for field_name, fetch in _choice_queries(form_class):
+                        queries["%s.%s" % (name, field_name)] = fetch
+            item["seconds"] = time.perf_counter() - start
+            report.append(item)
+
+        report.extend(self._prefetch(queries))
+        return report
+
+    def _prefetch(self, queries):
+        """
+        Fetches the ``(backend, query, options)`` of ``queries``
+        concurrently, storing their results in :py:attr:`choices`.
+        """
+        start = time.perf_counter()
+        done = {}
+        dispatch = {}
+
+        def finished(name):
+            done[name] = time.perf_counter() - start
+
+        futures = {}
+        for name, (backend, query, options) in queries.items():
+            started = time.perf_counter()
+            future = backend.fetch_async(query, **options)
+            # Only ndb futures tell when they are done.
+            if hasattr(future, "add_callback"):
+                future.add_callback(finished, name)
+            futures[name] = future
+            dispatch[name] = time.perf_counter() - started
+
+        report = []
+        for name, future in futures.items():
+            item = {"name": name, "type": "query"}
+            waited = time.perf_counter()
+            try:
+                self.choices[name] = future.get_result()
+            except Exception as exc:
+                item["error"] = exc
+            if name not in done:
+                # Time the other futures by their own dispatch and wait, so
+                # the waits on the futures before them aren't added up.
+                done[name] = dispatch[name] + time.perf_counter() - waited
+            item["seconds"] = done[name]
+            report.append(item)
+        return report
+
+
+def _resolve_reference_classes(form_class):
+    """
+    Replaces the kind names given as ``reference_class`` to the key fields of
+    a form class with the model classes, so bound fields don't look them up.
+    """
+    for _, field in key_fields(form_class):
+        kind = field.kwargs.get("reference_class")
+        if isinstance(kind, str):
+            from google.appengine.ext import ndb
+
+            field.kwargs["reference_class"] = ndb.Model._lookup_model(kind)
+
+
+def _choice_queries(form_class):
+    """
+    Yields the ``name, (backend, query, options)`` pairs of the choice
+    queries of the key fields of a form class, as their bound fields fetch
+    them. Fields given a callable ``query`` or ``ancestor`` are skipped, as
+    their query depends on the request.
+    """
+    for name, field in key_fields(form_class):
+        kwargs = field.kwargs
+        query = kwargs.get("query")
+        if callable(query) or callable(kwargs.get("ancestor")):
+            continue
+        backend = kwargs.get("backend") or field.field_class.backend
+        if query is None:
+            reference_class = kwargs.get("reference_class")
+            if reference_class is None:
+                continue
+            query = backend.query(
+                reference_class,
+                ancestor=kwargs.get("ancestor"),
+                filters=kwargs.get("query_filters", ()),
+                order=kwargs.get("query_order", ()),
+            )
+        yield name, (backend, query, kwargs.get("query_options") or {})